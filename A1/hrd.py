@@ -1,8 +1,56 @@
-import sys
+import argparse
+import array
+import bisect
+import collections
+import glob
 import heapq
-from typing import Any, List, Optional
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import signal
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+# The board has 5 rows and 4 columns. Square k is at row k//4, column k%4.
+ROWS = 5
+COLS = 4
+CELLS = ROWS * COLS
+# A board is packed into one int as a 20-digit octal number, one digit per
+# square from left to right, from top to bottom. SHIFT[k] is the bit offset
+# of square k and BIT[k] is its place value, so that moving a piece labelled
+# v from square a to square b adds v * (BIT[b] - BIT[a]) to the board.
+SHIFT = [3 * (CELLS - 1 - k) for k in range(CELLS)]
+BIT = [1 << s for s in SHIFT]
+# The bits of the two goal squares of the 2x2 piece, state[4][1] and
+# state[4][2], and their value when the 2x2 piece is there.
+GOAL_MASK = 0o77 << SHIFT[18]
+GOAL_BITS = 0o11 << SHIFT[18]
+
+
+def encode(state: List[list[str]]) -> int:
+    """Return the packed board of the list-of-lists <state>."""
+    return int("".join("".join(row) for row in state), 8)
+
+
+def decode(board: int) -> List[list[str]]:
+    """Return the list-of-lists state of the packed <board>."""
+    digits = format(board, "020o")
+    return [list(digits[i:i + COLS]) for i in range(0, CELLS, COLS)]
+
+
+def cell(board: int, k: int) -> int:
+    """Return the label of square <k> on the packed <board>."""
+    return (board >> SHIFT[k]) & 7
 
-# Implement a data structure to store a state. 
+
+# Implement a data structure to store a state.
 class Node:
     """A node that stores the state representing the position of
     ten pieces on the Hua Rong Dao puzzle board. 
@@ -13,44 +61,57 @@ class Node:
     === Attributes ===
     parent:
         The parent node of this node.
-    state:
-        The list storing five lists to represent the position of 
-        ten pieces on the Hua Rong Dao puzzle board.
     id:
-        A 20-digit int which is consist of all number in the state
-        from left to right, from top to bottom.
+        The packed board, i.e. an int whose octal digits are all numbers
+        in the state from left to right, from top to bottom.
+    empty:
+        The squares of the two empty pieces, in increasing order.
+    square:
+        The top-left square of the 2x2 piece.
     cost:
         An int representing the cost from the start state to the state
         stored in this Node.
 
+    A Node storing a state of a SlidingPuzzle uses that puzzle's packing
+    for id and the bitmask of its empty squares for empty, and its square
+    is -1.
+
     === Representation Invariants ===
-    - len(state) == 5
-    - for 0 <= i <= 4, len(state[i]) == 4; and for 0 <= j <= 3, 
-    0 <= int(state[i][j]) <= 7
+    - 0 <= id < 8 ** 20
+    - empty[0] < empty[1] and both digits of id at empty are 0
+    - the digits of id at square, square + 1, square + 4 and square + 5
+      are 1
     """
+    __slots__ = ("parent", "id", "empty", "square", "cost")
     parent: Optional[Any]
-    state: List[list[str]]
     id: int
+    empty: Tuple[int, int]
+    square: int
     cost: int
     
-    def __init__(self, state: List[list[str]]) -> None:
+    def __init__(self, board: int, empty: Tuple[int, int],
+                 square: int = -1) -> None:
         """Initialize a new Node."""
         self.parent = None
-        self.state = state
-        result = ""
-        for i in self.state:
-            s = "".join(i)
-            result += s
-        self.id = int(result)
+        self.id = board
+        self.empty = empty
+        self.square = square
         self.cost = 0
+
+    @property
+    def state(self) -> List[list[str]]:
+        """The list storing five lists to represent the position of 
+        ten pieces on the Hua Rong Dao puzzle board. It is only built on
+        demand, e.g. for output.
+        """
+        return decode(self.id)
     
     def __str__(self) -> str:
         """The string representation of this node."""
+        digits = format(self.id, "020o")
         result = ""
-        for i in self.state:
-            s = "".join(i)
-            s += "\n"
-            result += s
+        for i in range(0, CELLS, COLS):
+            result += digits[i:i + COLS] + "\n"
         return result
     
     def __eq__(self, other) -> bool:
@@ -94,220 +155,140 @@ class Stack:
         else:
             return self.lst.pop()
 
+    def __len__(self) -> int:
+        """Return the number of items in this stack."""
+        return len(self.lst)
+
 # Implement a function which tests whether a state is a goal state.
 def test_goal(given: Node) -> bool:
     """Return True is the state stored in <given> is a goal state. 
     Otherwise, return False.
     """
-    if given.state[4][1] != '1' or given.state[4][2] != '1':
-        return False
-    return True
+    return given.id & GOAL_MASK == GOAL_BITS
 
-# A helper function for successors().
-def is_vertical(given: Node, x: int, y: int) -> bool:
-    """Return True if the piece at <given>[<x>][<y>] is vertical 1x2 piece. 
-    Otherwise, return False.
+# A helper function for build_moves().
+def neighbour(k: int, step: int) -> int:
+    """Return the square next to square <k> in the direction <step>, which
+    is one of -COLS (up), -1 (left), COLS (down) and 1 (right). 
+    Return -1 if that square is off the board.
     """
-    if given.state[x][y] == '0' or given.state[x][y] == '1':
-        return False
-    if x != 0 and given.state[x][y] == given.state[x-1][y]:
-        return True
-    if x != 4 and given.state[x][y] == given.state[x+1][y]:
-        return True
-    return False
+    if step == -COLS:
+        return k - COLS if k >= COLS else -1
+    if step == COLS:
+        return k + COLS if k < CELLS - COLS else -1
+    if step == -1:
+        return k - 1 if k % COLS != 0 else -1
+    return k + 1 if k % COLS != COLS - 1 else -1
 
-# A helper function for successors().
-def is_horizontal(given: Node, x: int, y: int) -> bool:
-    """Return True if the piece at <given>[<x>][<y>] is horizontal 1x2 piece. 
-    Otherwise, return False.
+# A helper function for build_moves().
+# Every pair of squares (k1, k2) with k1 < k2 is stored once, at index
+# k1 * CELLS + k2, so that nodes share the tuples of their empty squares.
+PAIRS = [(k1, k2) if k1 < k2 else None
+         for k1 in range(CELLS) for k2 in range(CELLS)]
+
+def empty_pair(k1: int, k2: int) -> Tuple[int, int]:
+    """Return the squares <k1> and <k2> in increasing order."""
+    if k1 < k2:
+        return PAIRS[k1 * CELLS + k2]
+    return PAIRS[k2 * CELLS + k1]
+
+def build_moves() -> List[list]:
+    """Return the move table used by successors().
+
+    The entry at index zero1 * CELLS + zero2 lists every slide that may be
+    legal when the empty pieces are at squares zero1 < zero2, in the order
+    successors() generates them. Each slide is a tuple (n, m, table): the
+    slide is legal if table[label] is not None for the label at square n 
+    and, unless m is -1, square m has the same label. table[label] is then 
+    a tuple (delta, empty, step) where delta is added to the packed board,
+    empty is the new pair of empty squares and step is added to the square
+    of the 2x2 piece.
     """
-    if given.state[x][y] == '0' or given.state[x][y] == '1':
-        return False
-    if y != 0 and given.state[x][y] == given.state[x][y-1]:
-        return True
-    if y != 3 and given.state[x][y] == given.state[x][y+1]:
-        return True
-    return False
-
-# A helper function for successors().
-def copy_state(given: Node) -> list:
-    """Return a copy of the state stored in <given>.
-    """
-    new_state = []
-    for i in given.state:
-        new_state.append(i[:])
-    return new_state
-
-# A helper function for successors().
-def move_single_empty(zero: tuple, given: Node, result: list) -> list:
-    """Add a list of successor states of <given> when the empty piece at
-    <zero> is moved to <result>, and then return this list.
-    """
-    # Move upward.
-    if zero[0] != 0:
-        if given.state[zero[0]-1][zero[1]] == '7' or \
-            is_vertical(given, zero[0]-1, zero[1]):
-                new_state = copy_state(given)
-                if given.state[zero[0]-1][zero[1]] == '7':
-                    new_state[zero[0]][zero[1]] = '7'
-                    new_state[zero[0]-1][zero[1]] = '0'
-                else:
-                    new_state[zero[0]][zero[1]] = new_state[zero[0]-1][zero[1]]
-                    new_state[zero[0]-2][zero[1]] = '0'
-                new = Node(new_state)
-                new.parent = given
-                new.cost = given.cost + 1
-                result.append(new)
-    # Move left.
-    if zero[1] != 0:
-        if given.state[zero[0]][zero[1]-1] == '7' or\
-            is_horizontal(given, zero[0], zero[1]-1):
-                new_state = copy_state(given)
-                if given.state[zero[0]][zero[1]-1] == '7':
-                    new_state[zero[0]][zero[1]] = '7'
-                    new_state[zero[0]][zero[1]-1] = '0'
-                else:
-                    new_state[zero[0]][zero[1]] = new_state[zero[0]][zero[1]-1]
-                    new_state[zero[0]][zero[1]-2] = '0'
-                new = Node(new_state)
-                new.parent = given
-                new.cost = given.cost + 1
-                result.append(new)
-    # Move downward.
-    if zero[0] != 4:
-        if given.state[zero[0]+1][zero[1]] == '7' or\
-            is_vertical(given, zero[0]+1, zero[1]):
-                new_state = copy_state(given)
-                if given.state[zero[0]+1][zero[1]] == '7':
-                    new_state[zero[0]][zero[1]] = '7'
-                    new_state[zero[0]+1][zero[1]] = '0'
-                else:
-                    new_state[zero[0]][zero[1]] = new_state[zero[0]+1][zero[1]]
-                    new_state[zero[0]+2][zero[1]] = '0'
-                new = Node(new_state)
-                new.parent = given
-                new.cost = given.cost + 1
-                result.append(new)
-    # Move right.
-    if zero[1] != 3:
-        if given.state[zero[0]][zero[1]+1] == '7' or\
-            is_horizontal(given, zero[0], zero[1]+1):
-                new_state = copy_state(given)
-                if given.state[zero[0]][zero[1]+1] == '7':
-                    new_state[zero[0]][zero[1]] = '7'
-                    new_state[zero[0]][zero[1]+1] = '0'
-                else:
-                    new_state[zero[0]][zero[1]] = new_state[zero[0]][zero[1]+1]
-                    new_state[zero[0]][zero[1]+2] = '0'
-                new = Node(new_state)
-                new.parent = given
-                new.cost = given.cost + 1
-                result.append(new)
-    return result
+    moves = [[] for _ in range(CELLS * CELLS)]
+    for zero1 in range(CELLS):
+        for zero2 in range(zero1 + 1, CELLS):
+            lst = moves[zero1 * CELLS + zero2]
+            # Two empty pieces are moved together. A horizontal pair of
+            # empty pieces takes pieces from above and below, a vertical
+            # pair takes pieces from the left and right.
+            if zero1 + 1 == zero2 and zero2 % COLS != 0:
+                steps = (-COLS, COLS)
+            elif zero1 + COLS == zero2:
+                steps = (-1, 1)
+            else:
+                steps = ()
+            for step in steps:
+                n1 = neighbour(zero1, step)
+                n2 = neighbour(zero2, step)
+                if n1 < 0:
+                    continue
+                table = [None] * 8
+                delta = BIT[zero1] + BIT[zero2] - BIT[n1] - BIT[n2]
+                for label in range(2, 7):
+                    table[label] = (label * delta, empty_pair(n1, n2), 0)
+                far1 = neighbour(n1, step)
+                far2 = neighbour(n2, step)
+                if far1 >= 0:
+                    delta = BIT[zero1] + BIT[zero2] - BIT[far1] - BIT[far2]
+                    table[1] = (delta, empty_pair(far1, far2), -step)
+                lst.append((n1, n2, tuple(table)))
+            # Only one empty piece is moved, in the order up, left, down,
+            # right, by a single piece or by a 1x2 piece along its length.
+            for zero, other in ((zero1, zero2), (zero2, zero1)):
+                for step in (-COLS, -1, COLS, 1):
+                    n = neighbour(zero, step)
+                    if n < 0:
+                        continue
+                    delta = BIT[zero] - BIT[n]
+                    table = [None] * 8
+                    table[7] = (7 * delta, empty_pair(n, other), 0)
+                    lst.append((n, -1, tuple(table)))
+                    far = neighbour(n, step)
+                    if far < 0:
+                        continue
+                    table = [None] * 8
+                    delta = BIT[zero] - BIT[far]
+                    for label in range(2, 7):
+                        table[label] = (label * delta,
+                                        empty_pair(far, other), 0)
+                    lst.append((n, far, tuple(table)))
+    return moves
+
+MOVES = build_moves()
 
 # Implement a function which takes a state and returns a list of 
 # its successor states. 
 def successors(given: Node) -> List[Node]:
     """Return a list of successor states of <given>."""
     result = []
-    general = []
-    for i in given.state:
-        general += i
-    num = general.index('0')
-    num2 = num + 1 + general[num+1:].index('0')
-    zero1 = (num//4, num%4)
-    zero2 = (num2//4, num2%4)
-    # Two empty pieces are moved together.
-    # These two empty pieces form a horizontal 1x2 piece.
-    if zero1[0] == zero2[0] and zero1[1] + 1 == zero2[1]:
-        # Move upward.
-        if zero1[0] != 0 and given.state[zero1[0]-1][zero1[1]] != '7' and \
-            given.state[zero1[0]-1][zero1[1]] == \
-                given.state[zero2[0]-1][zero2[1]]:
-                    new_state = copy_state(given)
-                    char = given.state[zero1[0]-1][zero1[1]]
-                    if char == '1':
-                        new_state[zero1[0]][zero1[1]] = char
-                        new_state[zero2[0]][zero2[1]] = char
-                        new_state[zero1[0]-2][zero1[1]] = '0'
-                        new_state[zero2[0]-2][zero2[1]] = '0'
-                    else:
-                        new_state[zero1[0]][zero1[1]] = char
-                        new_state[zero2[0]][zero2[1]] = char
-                        new_state[zero1[0]-1][zero1[1]] = '0'
-                        new_state[zero2[0]-1][zero2[1]] = '0'
-                    new = Node(new_state)
-                    new.parent = given
-                    new.cost = given.cost + 1
-                    result.append(new)
-        # Move downward.
-        if zero1[0] != 4 and given.state[zero1[0]+1][zero1[1]] != '7' and \
-            given.state[zero1[0]+1][zero1[1]] == \
-                given.state[zero2[0]+1][zero2[1]]:
-                    new_state = copy_state(given)
-                    char = given.state[zero1[0]+1][zero1[1]]
-                    if char == '1':
-                        new_state[zero1[0]][zero1[1]] = char
-                        new_state[zero2[0]][zero2[1]] = char
-                        new_state[zero1[0]+2][zero1[1]] = '0'
-                        new_state[zero2[0]+2][zero2[1]] = '0'
-                    else:
-                        new_state[zero1[0]][zero1[1]] = char
-                        new_state[zero2[0]][zero2[1]] = char
-                        new_state[zero1[0]+1][zero1[1]] = '0'
-                        new_state[zero2[0]+1][zero2[1]] = '0'
-                    new = Node(new_state)
-                    new.parent = given
-                    new.cost = given.cost + 1
-                    result.append(new)
-    # These two empty pieces form a vertical 1x2 piece.
-    if zero1[0] + 1 == zero2[0] and zero1[1] == zero2[1]:
-        # Move left.
-        if zero1[1] != 0 and given.state[zero1[0]][zero1[1]-1] != '7' and \
-            given.state[zero1[0]][zero1[1]-1] == \
-                given.state[zero2[0]][zero2[1]-1]:
-                    new_state = copy_state(given)
-                    char = given.state[zero1[0]][zero1[1]-1]
-                    if char == '1':
-                        new_state[zero1[0]][zero1[1]] = char
-                        new_state[zero2[0]][zero2[1]] = char
-                        new_state[zero1[0]][zero1[1]-2] = '0'
-                        new_state[zero2[0]][zero2[1]-2] = '0'
-                    else:
-                        new_state[zero1[0]][zero1[1]] = char
-                        new_state[zero2[0]][zero2[1]] = char
-                        new_state[zero1[0]][zero1[1]-1] = '0'
-                        new_state[zero2[0]][zero2[1]-1] = '0'
-                    new = Node(new_state)
-                    new.parent = given
-                    new.cost = given.cost + 1
-                    result.append(new)
-        # Move right.
-        if zero1[1] != 3 and given.state[zero1[0]][zero1[1]+1] != '7' and \
-            given.state[zero1[0]][zero1[1]+1] == \
-                given.state[zero2[0]][zero2[1]+1]:
-                    new_state = copy_state(given)
-                    char = given.state[zero1[0]][zero1[1]+1]
-                    if char == '1':
-                        new_state[zero1[0]][zero1[1]] = char
-                        new_state[zero2[0]][zero2[1]] = char
-                        new_state[zero1[0]][zero1[1]+2] = '0'
-                        new_state[zero2[0]][zero2[1]+2] = '0'
-                    else:
-                        new_state[zero1[0]][zero1[1]] = char
-                        new_state[zero2[0]][zero2[1]] = char
-                        new_state[zero1[0]][zero1[1]+1] = '0'
-                        new_state[zero2[0]][zero2[1]+1] = '0'
-                    new = Node(new_state)
-                    new.parent = given
-                    new.cost = given.cost + 1
-                    result.append(new)
-    # Only one empty piece is moved.
-    result = move_single_empty(zero1, given, result)
-    result = move_single_empty(zero2, given, result)
-    
+    board = given.id
+    new_cost = given.cost + 1
+    for n, m, table in MOVES[given.empty[0] * CELLS + given.empty[1]]:
+        label = (board >> SHIFT[n]) & 7
+        move = table[label]
+        if move is None:
+            continue
+        if m >= 0 and (board >> SHIFT[m]) & 7 != label:
+            continue
+        new = Node(board + move[0], move[1], given.square + move[2])
+        new.parent = given
+        new.cost = new_cost
+        result.append(new)
     return result
 
+# A helper function for start_state().
+def find_empty(board: int) -> Tuple[int, int]:
+    """Return the squares of the two empty pieces on the packed <board>."""
+    digits = format(board, "020o")
+    num = digits.index('0')
+    num2 = digits.index('0', num + 1)
+    return PAIRS[num * CELLS + num2]
+
+# A helper function for start_state().
+def find_square(board: int) -> int:
+    """Return the top-left square of the 2x2 piece on the packed <board>."""
+    return format(board, "020o").index('1')
+
 # Implement a function to read in an initial configuration of 
 # the puzzle from an input file and store it as a state.
 def start_state(file: str) -> Node:
@@ -316,15 +297,74 @@ def start_state(file: str) -> Node:
     """
     f = open(file)
     state = []
-    i = 0
     for line in f:
-        lst = []
-        for x in line[:-1]:
-            lst.append(x)
-        state.append(lst)
-        i += 1
+        line = line.strip()
+        if line:
+            state.append(list(line))
     f.close()
-    return Node(state)
+    board = encode(state)
+    return Node(board, find_empty(board), find_square(board))
+
+# A helper function for build_rows().
+def output_row(row: List[int]) -> List[int]:
+    """Return the labels of one board <row> as output() prints them:
+    0 for empty squares, 1 for the 2x2 piece, 2 for horizontal 1x2 pieces,
+    3 for vertical 1x2 pieces and 4 for single pieces.
+    """
+    result = []
+    for j in range(COLS):
+        label = row[j]
+        if label == 7:
+            label = 4
+        elif label >= 2:
+            if (j != 0 and row[j - 1] == label) or \
+                (j != COLS - 1 and row[j + 1] == label):
+                label = 2
+            else:
+                label = 3
+        result.append(label)
+    return result
+
+def build_rows() -> Tuple[List[int], List[int]]:
+    """Return two tables indexed by the 12 bits of a packed board row. 
+    The first maps a row to the same row relabelled as output() does, and
+    the second to the relabelled row reflected left to right.
+
+    Within a row, a 1x2 piece is horizontal exactly when its neighbour
+    in the row has the same label, so a row can be relabelled on its own.
+    """
+    row_bits = 3 * COLS
+    plain = [0] * (1 << row_bits)
+    mirror = [0] * (1 << row_bits)
+    for bits in range(1 << row_bits):
+        row = [(bits >> (row_bits - 3 - 3 * j)) & 7 for j in range(COLS)]
+        labels = output_row(row)
+        for label in labels:
+            plain[bits] = (plain[bits] << 3) | label
+        for label in labels[::-1]:
+            mirror[bits] = (mirror[bits] << 3) | label
+    return plain, mirror
+
+ROW_PLAIN, ROW_MIRROR = build_rows()
+ROW_MASK = (1 << 3 * COLS) - 1
+
+def canonical(board: int) -> int:
+    """Return the canonical form of the packed <board>, which is shared by
+    every board that differs from it only by which of {2, 3, 4, 5, 6} 
+    labels which 1x2 piece, or by a left-right reflection.
+
+    Such boards have the same cost to a goal state, so the search only
+    needs to explore one of them.
+    """
+    plain = 0
+    mirror = 0
+    for shift in range(CELLS * 3 - 3 * COLS, -1, -3 * COLS):
+        row = (board >> shift) & ROW_MASK
+        plain = (plain << 3 * COLS) | ROW_PLAIN[row]
+        mirror = (mirror << 3 * COLS) | ROW_MIRROR[row]
+    if mirror < plain:
+        return mirror
+    return plain
 
 # Implement a function that takes a solution and 
 # returns the cost of the solution.
@@ -333,22 +373,520 @@ def cost(given: Node) -> int:
     """
     return given.cost
 
+class SlidingPuzzle:
+    """A sliding-block puzzle with a board of any size, pieces of any shape,
+    any number of empty squares and goal squares for any pieces. The
+    searches solve it instead of the Hua Rong Dao puzzle when it is passed
+    to them.
+
+    Square k is at row k // cols, column k % cols. A shape is a tuple of
+    (row, column) offsets from the anchor of the piece, the first square
+    it covers from left to right, from top to bottom. A state is packed
+    into one int holding the anchor of every piece, <bits> bits each, so
+    its size depends on the number of pieces rather than on the board.
+    Pieces of the same shape are interchangeable, so their anchors are
+    kept in increasing order and the packed state is its own canonical
+    form. The empty attribute of a Node is the bitmask of its empty
+    squares, bit k for square k.
+
+    === Attributes ===
+    rows:
+        The number of rows of the board.
+    cols:
+        The number of columns of the board.
+    shapes:
+        The shapes of the pieces.
+    groups:
+        For each shape, the indices (first, last + 1) of the pieces of that
+        shape. Pieces are indexed by shape, then by anchor.
+    labels:
+        The character printed for each piece, by index.
+    goals:
+        The goal placements, as pairs (shape, anchor) of a shape index and
+        a square. A state is a goal state if, for every pair, a piece of
+        that shape has that anchor.
+    start:
+        The Node storing the start state.
+
+    === Private attributes ===
+    bits:
+        The number of bits of one anchor in a packed state.
+    masks:
+        masks[s][k] is the bitmask of the squares covered by a piece of
+        shape s anchored at square k, or 0 if it does not fit there.
+    slides:
+        slides[s][k] lists the moves of a piece of shape s anchored at
+        square k, as tuples (anchor, enter, leave) of its new anchor, the
+        bitmask of the squares it enters, which must be empty, and the
+        bitmask of the squares it leaves.
+    """
+    rows: int
+    cols: int
+    shapes: List[tuple]
+    groups: List[Tuple[int, int]]
+    labels: List[str]
+    goals: List[Tuple[int, int]]
+    start: Node
+    bits: int
+    masks: List[List[int]]
+    slides: List[List[list]]
+
+    def __init__(self, rows: int, cols: int,
+                 pieces: List[Tuple[str, List[int]]],
+                 goals: List[Tuple[str, int]]) -> None:
+        """Initialize a new SlidingPuzzle with <rows> and <cols>, whose
+        start state has <pieces>, given as pairs of a label and the squares
+        the piece covers. <goals> are pairs of the label of a piece in the
+        start state and the square its anchor, or the anchor of a piece of
+        the same shape, must reach.
+
+        Raise ValueError if a goal names no piece.
+        """
+        self.rows = rows
+        self.cols = cols
+        cells = rows * cols
+        self.bits = max(1, (cells - 1).bit_length())
+        placed = []
+        for label, squares in pieces:
+            squares = sorted(squares)
+            anchor = squares[0]
+            shape = tuple((k // cols - anchor // cols, k % cols - anchor % cols)
+                          for k in squares)
+            placed.append((anchor, shape, label))
+        placed.sort()
+        self.shapes = []
+        for anchor, shape, label in placed:
+            if shape not in self.shapes:
+                self.shapes.append(shape)
+        self.groups = []
+        self.labels = []
+        anchors = []
+        for shape in self.shapes:
+            first = len(anchors)
+            for anchor, other, label in placed:
+                if other == shape:
+                    anchors.append(anchor)
+                    self.labels.append(label)
+            self.groups.append((first, len(anchors)))
+        self.goals = []
+        for label, anchor in goals:
+            if label not in self.labels:
+                raise ValueError("no piece is labelled " + label)
+            i = self.labels.index(label)
+            for s, (first, last) in enumerate(self.groups):
+                if first <= i < last:
+                    self.goals.append((s, anchor))
+        self.masks = []
+        self.slides = []
+        for shape in self.shapes:
+            masks = []
+            for k in range(cells):
+                mask = 0
+                for dr, dc in shape:
+                    r = k // cols + dr
+                    c = k % cols + dc
+                    if not (0 <= r < rows and 0 <= c < cols):
+                        mask = 0
+                        break
+                    mask |= 1 << (r * cols + c)
+                masks.append(mask)
+            slides = []
+            for k in range(cells):
+                lst = []
+                for dr, dc in ((-1, 0), (0, -1), (1, 0), (0, 1)):
+                    r = k // cols + dr
+                    c = k % cols + dc
+                    if masks[k] == 0 or not (0 <= r < rows and 0 <= c < cols):
+                        continue
+                    n = r * cols + c
+                    if masks[n] != 0:
+                        lst.append((n, masks[n] & ~masks[k],
+                                    masks[k] & ~masks[n]))
+                slides.append(lst)
+            self.masks.append(masks)
+            self.slides.append(slides)
+        board = self.pack(anchors)
+        self.start = Node(board, self.find_empty(board))
+
+    def pack(self, anchors: List[int]) -> int:
+        """Return the packed state with the anchors <anchors>, by index."""
+        board = 0
+        for anchor in reversed(anchors):
+            board = (board << self.bits) | anchor
+        return board
+
+    def unpack(self, board: int) -> List[int]:
+        """Return the anchors of the pieces in the packed state <board>."""
+        mask = (1 << self.bits) - 1
+        return [(board >> (i * self.bits)) & mask
+                for i in range(len(self.labels))]
+
+    def covered(self, board: int) -> List[int]:
+        """Return the bitmask of the squares covered by each piece in the
+        packed state <board>, by index.
+        """
+        anchors = self.unpack(board)
+        result = []
+        for s, (first, last) in enumerate(self.groups):
+            for i in range(first, last):
+                result.append(self.masks[s][anchors[i]])
+        return result
+
+    def find_empty(self, board: int) -> int:
+        """Return the bitmask of the empty squares of the packed state
+        <board>.
+        """
+        full = 0
+        for mask in self.covered(board):
+            full |= mask
+        return ((1 << self.rows * self.cols) - 1) & ~full
+
+    def node(self, board: int) -> Node:
+        """Return a new Node storing the packed state <board>."""
+        return Node(board, self.find_empty(board))
+
+    def successors(self, given: Node) -> List[Node]:
+        """Return a list of successor states of <given>."""
+        result = []
+        board = given.id
+        bits = self.bits
+        anchors = self.unpack(board)
+        empty = given.empty
+        new_cost = given.cost + 1
+        for s, (first, last) in enumerate(self.groups):
+            slides = self.slides[s]
+            # Only the anchors of the moved piece's shape are packed again.
+            rest = board & ~(((1 << (last - first) * bits) - 1)
+                             << first * bits)
+            for i in range(first, last):
+                for anchor, enter, leave in slides[anchors[i]]:
+                    if enter & empty != enter:
+                        continue
+                    if last - first == 1:
+                        packed = board + ((anchor - anchors[i]) << i * bits)
+                    else:
+                        moved = anchors[first:last]
+                        moved[i - first] = anchor
+                        moved.sort()
+                        packed = rest | (self.pack(moved) << first * bits)
+                    new = Node(packed, empty ^ enter | leave)
+                    new.parent = given
+                    new.cost = new_cost
+                    result.append(new)
+        return result
+
+    def test_goal(self, given: Node) -> bool:
+        """Return True if the state stored in <given> is a goal state.
+        Otherwise, return False.
+        """
+        anchors = self.unpack(given.id)
+        for s, anchor in self.goals:
+            first, last = self.groups[s]
+            if anchor not in anchors[first:last]:
+                return False
+        return True
+
+    def canonical(self, board: int) -> int:
+        """Return the canonical form of the packed state <board>, which is
+        <board> itself.
+        """
+        return board
+
+    def heuristic(self, given: Node) -> int:
+        """Return the largest Manhattan distance from a goal square to the
+        nearest anchor of a piece of its shape in the state <given>. A move
+        brings one piece one square closer, so the estimate is admissible.
+        """
+        anchors = self.unpack(given.id)
+        h = 0
+        for s, anchor in self.goals:
+            first, last = self.groups[s]
+            d = min(abs(a // self.cols - anchor // self.cols) +
+                    abs(a % self.cols - anchor % self.cols)
+                    for a in anchors[first:last])
+            if d > h:
+                h = d
+        return h
+
+    def output(self, given: Node) -> str:
+        """Return the representation of the state <given> in a solution,
+        one row per line. The empty squares are denoted by 0 and every
+        piece by its label.
+        """
+        grid = ['0'] * (self.rows * self.cols)
+        for i, mask in enumerate(self.covered(given.id)):
+            k = 0
+            while mask:
+                if mask & 1:
+                    grid[k] = self.labels[i]
+                mask >>= 1
+                k += 1
+        result = ""
+        for i in range(0, self.rows * self.cols, self.cols):
+            result += "".join(grid[i:i + self.cols]) + "\n"
+        return result
+
+def load_puzzle(file: str, general: bool = False) \
+        -> Tuple[Optional[SlidingPuzzle], Node]:
+    """Read a puzzle from <file> and return it with the Node storing its
+    start state. Unless <general> is True, the puzzle is None for a plain
+    5x4 Hua Rong Dao board, which is solved by the faster functions of
+    this module.
+
+    The file holds the rows of the board, with 0 or . for empty squares.
+    The squares with the same label form one piece, except for the labels
+    listed on lines "single <labels>", whose squares are all separate 1x1
+    pieces. Lines "goal <label> <row> <column>" ask for the piece with
+    that label, or any piece of the same shape, to be anchored at that
+    square. By default 7 labels the single pieces and the goal is the
+    piece labelled 1 at the bottom of the middle columns, as in Hua Rong
+    Dao. The file is read one line at a time.
+
+    Raise ValueError if the file is not a valid puzzle.
+    """
+    rows = []
+    singles = None
+    goals = []
+    f = open(file)
+    for line in f:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == "single":
+            singles = set("".join(words[1:]))
+        elif words[0] == "goal":
+            if len(words) != 4:
+                f.close()
+                raise ValueError("bad goal line: " + line.strip())
+            goals.append((words[1], int(words[2]), int(words[3])))
+        else:
+            rows.append(words[0].replace('.', '0'))
+    f.close()
+    if not rows or any(len(row) != len(rows[0]) for row in rows):
+        raise ValueError(file + " is not a rectangular board")
+    height = len(rows)
+    width = len(rows[0])
+    if not general and singles is None and not goals and \
+        (height, width) == (ROWS, COLS) \
+        and all(label in "01234567" for row in rows for label in row):
+        board = encode(rows)
+        return None, Node(board, find_empty(board), find_square(board))
+    if singles is None:
+        singles = {'7'}
+    pieces = {}
+    for k, label in enumerate("".join(rows)):
+        if label == '0':
+            continue
+        if label in singles:
+            pieces[(label, k)] = [k]
+        else:
+            pieces.setdefault((label, -1), []).append(k)
+    pieces = [(label, squares) for (label, _), squares in pieces.items()]
+    if not goals:
+        for label, squares in pieces:
+            if label == '1':
+                r = [k // width for k in squares]
+                c = [k % width for k in squares]
+                goals.append(('1', height - 1 - max(r) + min(r),
+                              (width - 1 - max(c) + min(c)) // 2))
+    if not goals:
+        raise ValueError(file + " has no goal")
+    puzzle = SlidingPuzzle(height, width, pieces,
+                           [(label, r * width + c) for label, r, c in goals])
+    return puzzle, puzzle.start
+
+def puzzle_rules(puzzle: Optional[SlidingPuzzle]) \
+        -> Tuple[Callable[[Node], List[Node]], Callable[[Node], bool],
+                 Callable[[int], int], Callable[[Node], int]]:
+    """Return the successor, goal test, canonical form and default
+    heuristic functions of <puzzle>, or of the Hua Rong Dao puzzle if it
+    is None.
+    """
+    if puzzle is None:
+        return successors, test_goal, canonical, Manhattan_h
+    return (puzzle.successors, puzzle.test_goal, puzzle.canonical,
+            puzzle.heuristic)
+
+class SearchStats:
+    """Counters and timers of one run of a search, for profiling. A search
+    given no SearchStats only pays for one None check per node it takes 
+    from the frontier.
+
+    === Attributes ===
+    name:
+        The name of the search.
+    expanded:
+        The number of nodes taken from the frontier and explored.
+    duplicates:
+        The number of nodes taken from the frontier whose state was 
+        already explored.
+    generated:
+        The number of successor nodes generated.
+    frontier_peak:
+        The largest number of nodes in the frontier.
+    successor_time:
+        The seconds spent in successors().
+    heuristic_time:
+        The seconds spent in the heuristic function.
+    elapsed:
+        The seconds the search took.
+    progress:
+        A function called with this SearchStats every <interval> expanded
+        nodes, or None.
+    interval:
+        The number of expanded nodes between two calls of progress.
+    """
+    name: str
+    expanded: int
+    duplicates: int
+    generated: int
+    frontier_peak: int
+    successor_time: float
+    heuristic_time: float
+    elapsed: float
+    progress: Optional[Callable[[Any], None]]
+    interval: int
+
+    def __init__(self, name: str,
+                 progress: Callable[[Any], None] = None,
+                 interval: int = 10000) -> None:
+        """Initialize a new SearchStats with all counters at zero."""
+        self.name = name
+        self.expanded = 0
+        self.duplicates = 0
+        self.generated = 0
+        self.frontier_peak = 0
+        self.successor_time = 0.0
+        self.heuristic_time = 0.0
+        self.elapsed = 0.0
+        self.progress = progress
+        self.interval = interval
+
+    def start(self) -> None:
+        """Start the clock of the search."""
+        self.elapsed = -time.perf_counter()
+
+    def stop(self) -> None:
+        """Stop the clock of the search."""
+        self.elapsed += time.perf_counter()
+
+    def expand(self, frontier_size: int) -> None:
+        """Count one expanded node, with <frontier_size> nodes left in the
+        frontier.
+        """
+        self.expanded += 1
+        if frontier_size > self.frontier_peak:
+            self.frontier_peak = frontier_size
+        if self.progress is not None and self.expanded % self.interval == 0:
+            self.progress(self)
+
+    def counted(self, expand: Callable[[Node], List[Node]]) \
+            -> Callable[[Node], List[Node]]:
+        """Return the successor function <expand>, counting and timing
+        every call.
+        """
+        def successors(given: Node) -> List[Node]:
+            begin = time.perf_counter()
+            result = expand(given)
+            self.successor_time += time.perf_counter() - begin
+            self.generated += len(result)
+            return result
+        return successors
+
+    def timed(self, heuristic: Callable[[Node], int]) \
+            -> Callable[[Node], int]:
+        """Return <heuristic>, timing every call."""
+        def h(given: Node) -> int:
+            begin = time.perf_counter()
+            result = heuristic(given)
+            self.heuristic_time += time.perf_counter() - begin
+            return result
+        return h
+
+    def summary(self) -> dict:
+        """Return the counters and timers as a dict for JSON output."""
+        taken = self.expanded + self.duplicates
+        return {"search": self.name,
+                "expanded": self.expanded,
+                "duplicates": self.duplicates,
+                "duplicate_rate": self.duplicates / taken if taken else 0.0,
+                "generated": self.generated,
+                "frontier_peak": self.frontier_peak,
+                "successor_seconds": self.successor_time,
+                "heuristic_seconds": self.heuristic_time,
+                "seconds": self.elapsed}
+
+def print_progress(stats: SearchStats) -> None:
+    """Print one line about the progress of a search to stderr."""
+    print("{}: {} expanded, {} generated, frontier peak {}, {:.2f} s".format(
+        stats.name, stats.expanded, stats.generated, stats.frontier_peak,
+        time.perf_counter() + stats.elapsed), file=sys.stderr)
+
+def board_node(board: int, puzzle: SlidingPuzzle = None) -> Node:
+    """Return a new Node storing the packed <board>, a state of <puzzle>,
+    or of the Hua Rong Dao puzzle if it is None.
+    """
+    if puzzle is None:
+        return Node(board, find_empty(board), find_square(board))
+    return puzzle.node(board)
+
+# A helper function for DFS().
+def rebuild(given: Node, path: List[int],
+            puzzle: SlidingPuzzle = None) -> Node:
+    """Return a Node storing the last packed board in <path>, with a chain
+    of parent nodes storing the boards before it, the first of which is 
+    the board stored in <given>. The boards are states of <puzzle>, or of
+    the Hua Rong Dao puzzle if it is None.
+    """
+    curr = given
+    for board in path[1:]:
+        new = board_node(board, puzzle)
+        new.parent = curr
+        new.cost = curr.cost + 1
+        curr = new
+    return curr
+
 # Implement a function that performs DFS given an initial state 
 # and returns a solution.
-def DFS(given: Node) -> Node:
+def DFS(given: Node, stats: SearchStats = None,
+        puzzle: SlidingPuzzle = None) -> Node:
     """Return a Node stored a goal state with a reference of 
-    its parent node after DFS."""
+    its parent node after DFS. Record what the search does in <stats> 
+    if it is given. <given> is a state of <puzzle>, or of the Hua Rong Dao
+    puzzle if it is None."""
+    expand, test_goal, canonical, _ = puzzle_rules(puzzle)
+    if stats is not None:
+        expand = stats.counted(expand)
+        stats.start()
     frontier = Stack()
     frontier.push(given)
     explored = set()
+    # The boards from <given> to the node being explored. A node popped
+    # from the stack is always a child of the node at depth cost - 1 on
+    # this path, so the frontier needs no references to parent nodes.
+    path = []
     while not frontier.is_empty():
         curr = frontier.pop()
-        if curr.id not in explored:
-            explored.add(curr.id)
+        key = canonical(curr.id)
+        if key not in explored:
+            explored.add(key)
+            if stats is not None:
+                stats.expand(len(frontier))
+            del path[curr.cost - given.cost:]
+            path.append(curr.id)
             if test_goal(curr):
-                return curr
-            for i in successors(curr):
+                if stats is not None:
+                    stats.stop()
+                # Free the search before the path nodes are built.
+                frontier = explored = None
+                return rebuild(given, path, puzzle)
+            for i in expand(curr):
+                i.parent = None
                 frontier.push(i)
+        elif stats is not None:
+            stats.duplicates += 1
+    if stats is not None:
+        stats.stop()
     return None
 
 # Implement a function which takes a state and returns the heuristic 
@@ -358,10 +896,7 @@ def DFS(given: Node) -> Node:
 def Manhattan_h(given: Node) -> int:
     """Return the Manhattan distance heuristic estimate for the state <given>.
     """
-    general = []
-    for i in given.state:
-        general += i
-    num = 20 - general[::-1].index('0') - 1
+    num = given.square + COLS + 1
     lower_right = (num//4, num%4)
     h = abs(4 - lower_right[0]) + abs(2 - lower_right[1])
     return h
@@ -371,10 +906,7 @@ def advanced_h(given: Node) -> int:
     The advanced heuristic function here is admissible but dominates 
     the Manhattan distance heuristic.
     """
-    general = []
-    for i in given.state:
-        general += i
-    num = 20 - general[::-1].index('0') - 1
+    num = given.square + COLS + 1
     lower_right = (num//4, num%4)
     h = abs(4 - lower_right[0]) + abs(2 - lower_right[1])
     if lower_right[0] == 1:
@@ -383,6 +915,233 @@ def advanced_h(given: Node) -> int:
         h += 1
     return h
 
+# Rows of a pattern board, i.e. a board relabelled as output() does in
+# which the single pieces are removed. ROW_PATTERN maps a packed board row 
+# to its pattern row, ROW_PATTERN_MIRROR to the reflected pattern row and 
+# ROW_REVERSE reflects a pattern row.
+ROW_PATTERN = [int(format(v, "04o").replace('4', '0'), 8) for v in ROW_PLAIN]
+ROW_PATTERN_MIRROR = [int(format(v, "04o").replace('4', '0'), 8)
+                      for v in ROW_MIRROR]
+ROW_REVERSE = [int(format(v, "04o")[::-1], 8) for v in range(1 << 3 * COLS)]
+# The squares covered by a 2x2 (1), horizontal (2) or vertical (3) piece
+# whose top-left square is 0.
+SHAPES = {1: (0, 1, COLS, COLS + 1), 2: (0, 1), 3: (0, COLS)}
+# Distance files start with a magic string, the number of entries and the
+# number of horizontal and vertical 1x2 pieces they were built for.
+DISTANCE_HEADER = struct.Struct("=8sIHH")
+PDB_MAGIC = b"HRDPDB01"
+TABLE_MAGIC = b"HRDTAB01"
+
+def pattern(board: int) -> int:
+    """Return the pattern board of the packed <board>, i.e. <board> with the
+    1x2 pieces relabelled by shape and the single pieces removed, reflected
+    left to right if that gives a smaller int.
+    """
+    plain = 0
+    mirror = 0
+    for shift in range(CELLS * 3 - 3 * COLS, -1, -3 * COLS):
+        row = (board >> shift) & ROW_MASK
+        plain = (plain << 3 * COLS) | ROW_PATTERN[row]
+        mirror = (mirror << 3 * COLS) | ROW_PATTERN_MIRROR[row]
+    if mirror < plain:
+        return mirror
+    return plain
+
+def reflect(board: int) -> int:
+    """Return the packed or pattern <board> reflected left to right."""
+    result = 0
+    for shift in range(CELLS * 3 - 3 * COLS, -1, -3 * COLS):
+        result = (result << 3 * COLS) | ROW_REVERSE[(board >> shift) & ROW_MASK]
+    return result
+
+def inventory(board: int) -> Tuple[int, int]:
+    """Return the number of horizontal and vertical 1x2 pieces on the
+    packed <board>.
+    """
+    digits = format(pattern(board), "020o")
+    return digits.count('2') // 2, digits.count('3') // 2
+
+# A helper function for build_pdb().
+def pattern_successors(board: int) -> List[int]:
+    """Return the pattern boards reachable from the pattern board <board>
+    by sliding one piece by one square onto squares that are not covered
+    by another piece.
+    """
+    result = []
+    seen = 0
+    for k in range(CELLS):
+        label = cell(board, k)
+        if label == 0 or seen >> k & 1:
+            continue
+        squares = [k + d for d in SHAPES[label]]
+        for s in squares:
+            seen |= 1 << s
+        for step in (-COLS, -1, COLS, 1):
+            moved = []
+            for s in squares:
+                n = neighbour(s, step)
+                if n < 0:
+                    break
+                moved.append(n)
+            else:
+                if all(n in squares or cell(board, n) == 0 for n in moved):
+                    new = board
+                    for s in squares:
+                        new -= label * BIT[s]
+                    for n in moved:
+                        new += label * BIT[n]
+                    result.append(new)
+    return result
+
+# A helper function for build_pdb().
+def pattern_goals(horizontal: int, vertical: int) -> set:
+    """Return every pattern board with the 2x2 piece at its goal position,
+    <horizontal> horizontal and <vertical> vertical 1x2 pieces.
+    """
+    square = 1 * sum(BIT[13 + d] for d in SHAPES[1])
+    result = set()
+
+    def place(board: int, h: int, v: int, first: int) -> None:
+        if h == 0 and v == 0:
+            result.add(min(board, reflect(board)))
+            return
+        label = 2 if h > 0 else 3
+        for k in range(first, CELLS):
+            squares = [k]
+            for d in SHAPES[label][1:]:
+                n = neighbour(k, 1 if d == 1 else COLS)
+                if n < 0:
+                    break
+                squares.append(n)
+            else:
+                if all(cell(board, s) == 0 for s in squares):
+                    new = board + sum(label * BIT[s] for s in squares)
+                    if label == 2:
+                        place(new, h - 1, v, k + 1 if h > 1 else 0)
+                    else:
+                        place(new, h, v - 1, k + 1)
+
+    place(square, horizontal, vertical, 0)
+    return result
+
+def build_pdb(given: Node, file: str) -> int:
+    """Build the pattern database for the pieces on the board stored in
+    <given>, write it to <file> and return the number of entries.
+
+    The pattern keeps the 2x2 piece and all 1x2 pieces (the blockers) and
+    removes the single pieces. Every move in the puzzle is either a move
+    of the same piece in the pattern or a move of a single piece, so the
+    number of pattern moves to a goal never exceeds the real cost, i.e. the
+    database is an admissible and consistent heuristic.
+
+    The file format is described in write_distances().
+    """
+    horizontal, vertical = inventory(given.id)
+    distance = {}
+    layer = list(pattern_goals(horizontal, vertical))
+    d = 0
+    while layer:
+        for board in layer:
+            distance[board] = d
+        d += 1
+        nxt = set()
+        for board in layer:
+            for new in pattern_successors(board):
+                new = min(new, reflect(new))
+                if new not in distance:
+                    nxt.add(new)
+        layer = list(nxt)
+    return write_distances(file, PDB_MAGIC, distance, horizontal, vertical)
+
+def write_distances(file: str, magic: bytes, distance: dict,
+                    horizontal: int, vertical: int) -> int:
+    """Write <distance>, which maps boards to their cost to a goal, to the
+    distance file <file> and return the number of entries.
+
+    The file holds a header (<magic>, number of entries, <horizontal> and
+    <vertical>), the sorted boards as unsigned 64-bit ints and then the 
+    distance of each one as an unsigned byte, all in native byte order.
+    The rank of a board in the sorted boards is a minimal perfect hash,
+    found by binary search.
+    """
+    if distance and max(distance.values()) > 255:
+        raise ValueError("distances do not fit in one byte")
+    keys = sorted(distance)
+    f = open(file, 'wb')
+    f.write(DISTANCE_HEADER.pack(magic, len(keys), horizontal, vertical))
+    array.array('Q', keys).tofile(f)
+    f.write(bytes(distance[k] for k in keys))
+    f.close()
+    return len(keys)
+
+class DistanceFile:
+    """A distance file written by write_distances(), memory mapped from 
+    disk.
+
+    === Attributes ===
+    horizontal:
+        The number of horizontal 1x2 pieces the file was built for.
+    vertical:
+        The number of vertical 1x2 pieces the file was built for.
+
+    === Private attributes ===
+    mm:
+        The memory map of the file.
+    keys:
+        The sorted boards in the file.
+    distance:
+        distance[i] is the cost from the board keys[i] to a goal.
+    """
+    horizontal: int
+    vertical: int
+    mm: mmap.mmap
+    keys: memoryview
+    distance: memoryview
+
+    def __init__(self, file: str, magic: bytes) -> None:
+        """Load the distance file stored in <file>, which must start with
+        <magic>.
+        """
+        f = open(file, 'rb')
+        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        found, n, self.horizontal, self.vertical = \
+            DISTANCE_HEADER.unpack_from(self.mm)
+        if found != magic:
+            raise ValueError(file + " is not a " + magic.decode() + " file")
+        view = memoryview(self.mm)
+        start = DISTANCE_HEADER.size
+        self.keys = view[start:start + 8 * n].cast('Q')
+        self.distance = view[start + 8 * n:start + 9 * n]
+
+    def lookup(self, key: int) -> int:
+        """Return the distance stored for the board <key>, or -1 if it is
+        not in the file.
+        """
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.distance[i]
+        return -1
+
+class PatternDatabase(DistanceFile):
+    """A pattern database written by build_pdb(), memory mapped from disk.
+    The boards in it are pattern boards.
+    """
+
+    def __init__(self, file: str) -> None:
+        """Load the pattern database stored in <file>."""
+        DistanceFile.__init__(self, file, PDB_MAGIC)
+
+    def heuristic(self, given: Node) -> int:
+        """Return the pattern database heuristic estimate for the state 
+        <given>. Fall back to the Manhattan distance for patterns that
+        are not in the database.
+        """
+        h = self.lookup(pattern(given.id))
+        if h >= 0:
+            return h
+        return Manhattan_h(given)
+
 # Implement a priority queue to store the frontier.
 class priority_queue:
     """A priority queue ordered by f(n) = g(n) + h(n).
@@ -391,58 +1150,844 @@ class priority_queue:
     priority queue, the item with the smallest f(n) is the one that is removed.
     When two or more items have the same f(n), the oldest one will be removed.
     
-    h(n) is the Manhattan distance heuristic function.
+    h(n) is the heuristic function given when the priority queue is
+    created, the Manhattan distance heuristic function by default. It must
+    return an int, since f(n) indexes a list of buckets.
+
+    An item is not added if an item storing a state with the same canonical
+    form and no higher cost g(n) was added before, or if that state was
+    closed, i.e. explored. Each state is queued at most once per 
+    improvement of its cost, and stale items are left in place and skipped
+    by the caller, which closes each state when it first removes it.
 
     === Private attributes ===
-    heap:
-        The items stored in this priority queue, which is a min-heap. Each item
-        stored as a tuple, where the third element is a Node storing a state
-        and the first element is the f value - the sum of the cost and the
-        heuristic estimate - for this state. In addition, the second element
-        is the order that this node is added into the priority queue.
+    heuristic:
+        The heuristic function h(n).
+    buckets:
+        buckets[f] holds the items whose f(n) is f, oldest first.
+    lowest:
+        No bucket before buckets[lowest] holds an item.
+    size:
+        The number of items stored in this priority queue.
+    best:
+        The lowest cost g(n) an item was added with, by the canonical form
+        of its state, for the states that are not closed.
+    closed:
+        The canonical forms of the closed states.
     """
-    lst: List
+    heuristic: Callable[[Node], int]
+    buckets: List[collections.deque]
+    lowest: int
+    size: int
+    best: dict
+    closed: set
 
-    def __init__(self) -> None:
+    def __init__(self, heuristic: Callable[[Node], int] = None) -> None:
         """Initialize a new empty priority queue."""
-        self.lst = []
+        if heuristic is None:
+            heuristic = Manhattan_h
+        self.heuristic = heuristic
+        self.buckets = []
+        self.lowest = 0
+        self.size = 0
+        self.best = {}
+        self.closed = set()
 
     def is_empty(self) -> bool:
         """Return whether this priority queue contains no items."""
-        return not self.lst
+        return self.size == 0
 
-    def enqueue(self, item: Node, order: int) -> None:
-        """Add a new element to the priority queue."""
-        heapq.heappush(self.lst, (cost(item)+Manhattan_h(item), order, item))
+    def enqueue(self, item: Node, key: int = None) -> bool:
+        """Add a new element to the priority queue, unless an element with
+        the same canonical form <key> and no higher cost was added before.
+        Return whether it was added.
+        """
+        if key is None:
+            key = canonical(item.id)
+        if key in self.closed:
+            return False
+        best = self.best.get(key)
+        if best is not None and best <= item.cost:
+            return False
+        self.best[key] = item.cost
+        f = cost(item) + self.heuristic(item)
+        while len(self.buckets) <= f:
+            self.buckets.append(collections.deque())
+        self.buckets[f].append(item)
+        if f < self.lowest:
+            self.lowest = f
+        self.size += 1
+        return True
+
+    def close(self, key: int) -> bool:
+        """Close the state whose canonical form is <key>, so that it is
+        never added again. Return False if it was already closed.
+        """
+        if key in self.closed:
+            return False
+        self.closed.add(key)
+        self.best.pop(key, None)
+        return True
 
     def dequeue(self) -> Optional[Node]:
         """Remove and return the element the priority queue."""
         if self.is_empty():
             return None
-        else:
-            return heapq.heappop(self.lst)[2]
+        while not self.buckets[self.lowest]:
+            self.lowest += 1
+        self.size -= 1
+        return self.buckets[self.lowest].popleft()
+
+    def __len__(self) -> int:
+        """Return the number of items in this priority queue."""
+        return self.size
 
 # Implement a function that performs A* search given an initial state 
 # and returns a solution. This solution should be the optimal solution 
 # if your heuristic is admissible.
-def A_star(given: Node) -> Node:
+def A_star(given: Node, heuristic: Callable[[Node], int] = None,
+           stats: SearchStats = None, puzzle: SlidingPuzzle = None) -> Node:
     """Return a Node stored a goal state with a reference of 
-    its parent node after A* search."""
-    order = 0
-    frontier = priority_queue()
-    frontier.enqueue(given, order)
-    explored = set()
+    its parent node after A* search with <heuristic>, the Manhattan
+    distance heuristic function by default. Record what the search does 
+    in <stats> if it is given. <given> is a state of <puzzle>, or of the
+    Hua Rong Dao puzzle if it is None."""
+    expand, test_goal, canonical, default = puzzle_rules(puzzle)
+    if heuristic is None:
+        heuristic = default
+    if stats is not None:
+        heuristic = stats.timed(heuristic)
+        expand = stats.counted(expand)
+        stats.start()
+    frontier = priority_queue(heuristic)
+    frontier.enqueue(given, canonical(given.id))
     while not frontier.is_empty():
         curr = frontier.dequeue()
-        if curr.id not in explored:
-            explored.add(curr.id)
+        # The frontier keeps the explored set, as closed states.
+        if frontier.close(canonical(curr.id)):
+            if stats is not None:
+                stats.expand(len(frontier))
             if test_goal(curr):
+                if stats is not None:
+                    stats.stop()
                 return curr
+            for i in expand(curr):
+                frontier.enqueue(i, canonical(i.id))
+        elif stats is not None:
+            stats.duplicates += 1
+    if stats is not None:
+        stats.stop()
+    return None
+
+# A helper function for anytime_A_star().
+def suboptimality(goal: Node, nodes: List[Node],
+                  estimate: Callable[[Node], int], weight: float) -> float:
+    """Return a bound on how many times the cost of <goal> can exceed the
+    optimal cost, given that every cheaper solution passes through one of
+    <nodes>, with <estimate> being an admissible heuristic and <weight>
+    the weight <goal> was found with.
+    """
+    if not nodes:
+        return 1.0
+    lowest = min(n.cost + estimate(n) for n in nodes)
+    if lowest <= 0:
+        return weight
+    return max(1.0, min(weight, goal.cost / lowest))
+
+# Implement a function that performs anytime A* search given an initial
+# state and returns a solution.
+def anytime_A_star(given: Node, heuristic: Callable[[Node], int] = None,
+                   weight: float = 3.0, step: float = 0.5,
+                   deadline: float = None,
+                   report: Callable[[Node, float], None] = None,
+                   puzzle: SlidingPuzzle = None) -> Node:
+    """Return a Node stored a goal state with a reference of its parent
+    node after anytime repairing A* (ARA*) search with <heuristic>, the
+    Manhattan distance heuristic function by default.
+
+    The search orders the frontier by f(n) = g(n) + w * h(n), starting
+    with w = <weight>, which quickly finds a solution costing at most w
+    times the optimal cost if the heuristic is admissible. It then lowers
+    w by <step> down to 1 and improves the solution, reusing the states
+    already found. <report> is called with every better solution as soon
+    as it is found, and after each weight whose bound is lower, with the
+    best solution so far and its bound. After <deadline> seconds the best
+    solution so far is returned, but never before the first solution is
+    found. <given> is a state of <puzzle>, or of the Hua Rong Dao puzzle
+    if it is None.
+    """
+    successors, test_goal, canonical, default = puzzle_rules(puzzle)
+    if heuristic is None:
+        heuristic = default
+    stop = None
+    if deadline is not None:
+        stop = time.monotonic() + deadline
+    # The heuristic estimate of every state found, by canonical form.
+    estimates = {}
+
+    def estimate(given: Node) -> int:
+        key = canonical(given.id)
+        if key not in estimates:
+            estimates[key] = heuristic(given)
+        return estimates[key]
+
+    # The cheapest node found for every state, by canonical form.
+    best = {canonical(given.id): given}
+    frontier = [(weight * estimate(given), 0, given)]
+    order = 0
+    closed = set()
+    # Closed states whose cost improved; they are reopened with the
+    # next weight.
+    incons = {}
+    goal = None
+    reported = None
+
+    def open_nodes() -> List[Node]:
+        # Every cheaper solution passes through an open or reopened state.
+        nodes = [entry[2] for entry in frontier
+                 if best[canonical(entry[2].id)] is entry[2]]
+        nodes += list(incons.values())
+        return [n for n in nodes if n.cost < goal.cost]
+
+    while True:
+        while frontier and (goal is None or frontier[0][0] < goal.cost):
+            if goal is not None and stop is not None and \
+                time.monotonic() > stop:
+                break
+            curr = heapq.heappop(frontier)[2]
+            key = canonical(curr.id)
+            if best[key] is not curr or key in closed:
+                continue
+            closed.add(key)
+            if test_goal(curr):
+                if goal is None or curr.cost < goal.cost:
+                    goal = curr
+                    if report is not None:
+                        # Until the weight is done, its bound does not hold.
+                        reported = (goal, suboptimality(goal, open_nodes(),
+                                                        estimate, math.inf))
+                        report(*reported)
+                continue
             for i in successors(curr):
-                order += 1
-                frontier.enqueue(i, order)
+                k = canonical(i.id)
+                old = best.get(k)
+                if old is None or i.cost < old.cost:
+                    best[k] = i
+                    if k in closed:
+                        incons[k] = i
+                    else:
+                        order += 1
+                        f = i.cost + weight * estimate(i)
+                        heapq.heappush(frontier, (f, order, i))
+        if goal is None:
+            return None
+        nodes = open_nodes()
+        bound = suboptimality(goal, nodes, estimate, weight)
+        if report is not None and reported != (goal, bound):
+            reported = (goal, bound)
+            report(goal, bound)
+        if bound <= 1.0 or weight <= 1.0 or \
+            (stop is not None and time.monotonic() > stop):
+            return goal
+        weight = max(1.0, weight - step)
+        frontier = []
+        for n in nodes:
+            order += 1
+            frontier.append((n.cost + weight * estimate(n), order, n))
+        heapq.heapify(frontier)
+        closed = set()
+        incons = {}
+
+# Implement a function that performs weighted A* search given an initial
+# state and returns a solution.
+def weighted_A_star(given: Node, heuristic: Callable[[Node], int] = None,
+                    weight: float = 2.0,
+                    puzzle: SlidingPuzzle = None) -> Node:
+    """Return a Node stored a goal state with a reference of its parent
+    node after weighted A* search, i.e. A* ordered by g(n) + <weight> * h(n)
+    with <heuristic>, the Manhattan distance heuristic function by default.
+    The solution costs at most <weight> times the optimal cost if the
+    heuristic is admissible. <given> is a state of <puzzle>, or of the Hua
+    Rong Dao puzzle if it is None.
+    """
+    return anytime_A_star(given, heuristic, weight, deadline=0,
+                          puzzle=puzzle)
+
+# A helper function for IDA_star().
+def ida_search(curr: Node, bound: int, heuristic: Callable[[Node], int],
+               table: dict, memory: int, rules: tuple) \
+        -> Tuple[Optional[Node], float]:
+    """Return a goal Node below <curr> whose f value is at most <bound>, or
+    None and the smallest f value above <bound> found below <curr>.
+
+    <table> maps the canonical form of some states visited in this
+    iteration to the lowest cost they were reached with; it holds at most
+    <memory> states. <rules> are the functions returned by puzzle_rules().
+    """
+    successors, test_goal, canonical, _ = rules
+    f = curr.cost + heuristic(curr)
+    if f > bound:
+        return None, f
+    if test_goal(curr):
+        return curr, f
+    key = canonical(curr.id)
+    seen = table.get(key)
+    if seen is not None and seen <= curr.cost:
+        return None, math.inf
+    if seen is not None or len(table) < memory:
+        table[key] = curr.cost
+    nxt = math.inf
+    for i in successors(curr):
+        # Do not undo the move that led to curr.
+        if curr.parent is not None and i.id == curr.parent.id:
+            continue
+        goal, f = ida_search(i, bound, heuristic, table, memory, rules)
+        if goal is not None:
+            return goal, f
+        if f < nxt:
+            nxt = f
+    return None, nxt
+
+# Implement a function that performs IDA* search given an initial state 
+# and returns a solution.
+def IDA_star(given: Node, heuristic: Callable[[Node], int] = None,
+             memory: int = 1 << 18, puzzle: SlidingPuzzle = None) -> Node:
+    """Return a Node stored a goal state with a reference of 
+    its parent node after IDA* search with <heuristic>, the Manhattan
+    distance heuristic function by default.
+
+    Only the nodes on the current path are kept, plus the lowest cost of
+    at most <memory> states to cut off duplicate paths, so the memory used
+    is bounded. The solution is optimal if the heuristic is admissible.
+    <given> is a state of <puzzle>, or of the Hua Rong Dao puzzle if it is
+    None.
+    """
+    rules = puzzle_rules(puzzle)
+    if heuristic is None:
+        heuristic = rules[3]
+    bound = heuristic(given)
+    while bound != math.inf:
+        goal, bound = ida_search(given, bound, heuristic, {}, memory, rules)
+        if goal is not None:
+            return goal
     return None
 
+# A helper function for RBFS().
+def rbfs_search(curr: Node, f_curr: float, bound: float,
+                heuristic: Callable[[Node], int], table: dict, memory: int,
+                rules: tuple) -> Tuple[Optional[Node], float]:
+    """Return a goal Node below <curr>, or None and the backed-up f value 
+    of <curr> once every node below it has an f value above <bound>.
+    <f_curr> is the stored f value of <curr>. <rules> are the functions
+    returned by puzzle_rules().
+
+    <table> maps the canonical form of at most <memory> states to the
+    lowest cost they were reached with, the canonical form of the state
+    they were first reached from at that cost and their last backed-up f
+    value. A state reached at a higher cost, or at the same cost from
+    another state, is cut off: the path recorded for it is no longer and
+    is searched in its place. A state reached again along its recorded
+    path starts from its backed-up f value.
+    """
+    successors, test_goal, canonical, _ = rules
+    if test_goal(curr):
+        return curr, f_curr
+    parent = canonical(curr.id)
+    children = []
+    for i in successors(curr):
+        # Do not undo the move that led to curr.
+        if curr.parent is not None and i.id == curr.parent.id:
+            continue
+        key = canonical(i.id)
+        seen = table.get(key)
+        if seen is not None and (seen[0] < i.cost or
+                                 seen[0] == i.cost and seen[1] != parent):
+            continue
+        f = max(i.cost + heuristic(i), f_curr)
+        if seen is None and len(table) < memory or \
+                seen is not None and seen[0] > i.cost:
+            table[key] = (i.cost, parent, f)
+        elif seen is not None:
+            f = max(f, seen[2])
+        children.append([f, len(children), i, key])
+    if not children:
+        return None, math.inf
+    while True:
+        children.sort()
+        best = children[0]
+        if best[0] > bound:
+            return None, best[0]
+        if len(children) > 1:
+            alternative = min(bound, children[1][0])
+        else:
+            alternative = bound
+        goal, best[0] = rbfs_search(best[2], best[0], alternative, heuristic,
+                                    table, memory, rules)
+        if goal is not None:
+            return goal, best[0]
+        seen = table.get(best[3])
+        if seen is not None and seen[:2] == (best[2].cost, parent):
+            table[best[3]] = (seen[0], parent, best[0])
+
+# Implement a function that performs recursive best-first search given
+# an initial state and returns a solution.
+def RBFS(given: Node, heuristic: Callable[[Node], int] = None,
+         memory: int = 1 << 18, puzzle: SlidingPuzzle = None) -> Node:
+    """Return a Node stored a goal state with a reference of 
+    its parent node after recursive best-first search with <heuristic>,
+    the Manhattan distance heuristic function by default.
+
+    Only the nodes on the current path and their siblings are kept, plus
+    how at most <memory> states were first reached, to cut off duplicate
+    paths. The solution is optimal if the heuristic is admissible. <given>
+    is a state of <puzzle>, or of the Hua Rong Dao puzzle if it is None.
+    """
+    rules = puzzle_rules(puzzle)
+    if heuristic is None:
+        heuristic = rules[3]
+    table = {rules[2](given.id): (given.cost, None, heuristic(given))}
+    return rbfs_search(given, heuristic(given), math.inf, heuristic, table,
+                       memory, rules)[0]
+
+# A helper function for bidirectional_BFS().
+def goal_states(given: Node) -> List[Node]:
+    """Return a Node for every goal state with the same pieces as the 
+    state stored in <given>, one per canonical form.
+    """
+    board = given.id
+    digits = format(board, "020o")
+    pieces = []
+    for label in range(2, 7):
+        if str(label) not in digits:
+            continue
+        k = digits.index(str(label))
+        if k % COLS != COLS - 1 and cell(board, k + 1) == label:
+            pieces.append((label, SHAPES[2]))
+        else:
+            pieces.append((label, SHAPES[3]))
+    singles = digits.count('7')
+    square = sum(BIT[13 + d] for d in SHAPES[1])
+    result = {}
+
+    def place(board: int, i: int) -> None:
+        if i == len(pieces):
+            if singles == 0:
+                key = canonical(board)
+                if key not in result:
+                    result[key] = board_node(board)
+                return
+            free = [k for k in range(CELLS) if cell(board, k) == 0]
+            for chosen in itertools.combinations(free, singles):
+                new = board + sum(7 * BIT[k] for k in chosen)
+                key = canonical(new)
+                if key not in result:
+                    result[key] = board_node(new)
+            return
+        label, shape = pieces[i]
+        for k in range(CELLS):
+            squares = [k + d for d in shape]
+            if squares[-1] >= CELLS or \
+                (shape == SHAPES[2] and k % COLS == COLS - 1):
+                continue
+            if all(cell(board, s) == 0 for s in squares):
+                place(board + sum(label * BIT[s] for s in squares), i + 1)
+
+    place(square, 0)
+    return list(result.values())
+
+# A helper function for bidirectional_BFS().
+def relabel(board: int, target: int) -> Callable[[int], int]:
+    """Return a function that maps a packed board to the frame of <target>,
+    i.e. reflects it and renames its 1x2 pieces the same way that turns
+    <board> into <target>. <board> and <target> must have the same
+    canonical form.
+    """
+    for mirrored in (False, True):
+        source = reflect(board) if mirrored else board
+        names = {}
+        for k in range(CELLS):
+            a = cell(source, k)
+            b = cell(target, k)
+            if a in (0, 1, 7) or b in (0, 1, 7):
+                if a != b:
+                    break
+            elif names.setdefault(str(a), str(b)) != str(b):
+                break
+        else:
+            table = str.maketrans(names)
+
+            def apply(other: int) -> int:
+                if mirrored:
+                    other = reflect(other)
+                return int(format(other, "020o").translate(table), 8)
+            return apply
+    raise ValueError("the two boards are not equivalent")
+
+# A helper function for bidirectional_BFS().
+def expand_layer(layer: List[Node], mine: dict, other: dict) \
+        -> Tuple[List[Node], Optional[Tuple[Node, Node]]]:
+    """Expand every Node in <layer>, recording new states in <mine>, and
+    return the next layer together with the pair of Nodes with the lowest
+    total cost where this side met <other>, or None if it did not.
+    """
+    nxt = []
+    meet = None
+    for curr in layer:
+        for i in successors(curr):
+            key = canonical(i.id)
+            if key in mine:
+                continue
+            mine[key] = i
+            nxt.append(i)
+            if key in other:
+                if meet is None or \
+                    i.cost + other[key].cost < meet[0].cost + meet[1].cost:
+                    meet = (i, other[key])
+    return nxt, meet
+
+# Implement a function that performs bidirectional BFS given an initial
+# state and returns a solution.
+def bidirectional_BFS(given: Node) -> Node:
+    """Return a Node stored a goal state with a reference of 
+    its parent node after a bidirectional breadth-first search.
+
+    The backward search starts from every goal state at once. Moves are
+    reversible, so it uses successors() as well. The side with the smaller
+    layer is expanded one full layer at a time, and the first layer that
+    meets the other side gives an optimal solution.
+    """
+    if test_goal(given):
+        return given
+    forward = {canonical(given.id): given}
+    backward = {}
+    for goal in goal_states(given):
+        backward[canonical(goal.id)] = goal
+    forward_layer = [given]
+    backward_layer = list(backward.values())
+    meet = None
+    while meet is None and forward_layer and backward_layer:
+        if len(forward_layer) <= len(backward_layer):
+            forward_layer, meet = expand_layer(forward_layer, forward,
+                                               backward)
+        else:
+            backward_layer, meet = expand_layer(backward_layer, backward,
+                                                forward)
+            if meet is not None:
+                meet = (meet[1], meet[0])
+    if meet is None:
+        return None
+    # Replay the backward half, renamed into the frame of the forward half.
+    curr, other = meet
+    apply = relabel(other.id, curr.id)
+    other = other.parent
+    while other is not None:
+        board = apply(other.id)
+        new = board_node(board)
+        new.parent = curr
+        new.cost = curr.cost + 1
+        curr = new
+        other = other.parent
+    return curr
+
+# A helper function for external_BFS().
+def unique(records: Iterable[int], shift: int) -> Iterator[int]:
+    """Yield the sorted <records> in order, skipping every record whose
+    canonical form, record >> <shift>, is the same as the one before.
+    """
+    last = None
+    for record in records:
+        key = record >> shift
+        if key != last:
+            last = key
+            yield record
+
+# A helper function for external_BFS().
+def subtract(records: Iterable[int], runs: List[Any],
+             shift: int) -> Iterator[int]:
+    """Yield the sorted <records> whose canonical form is in none of the
+    sorted <runs>, by merging them.
+    """
+    seen = heapq.merge(*runs)
+    other = next(seen, None)
+    for record in records:
+        key = record >> shift
+        while other is not None and other >> shift < key:
+            other = next(seen, None)
+        if other is None or other >> shift != key:
+            yield record
+
+# A helper function for external_BFS().
+def write_run(file: str, records: Iterable[int], size: int) -> int:
+    """Write the <records> to the run file <file>, <size> bytes each, and
+    return how many were written.
+
+    A record packs the canonical form of a state above its packed board.
+    Records are big-endian, so that the byte order of the file is the
+    order of the records.
+    """
+    count = 0
+    chunk = []
+    f = open(file, 'wb')
+    for record in records:
+        chunk.append(record.to_bytes(size, "big"))
+        if len(chunk) == 4096:
+            f.write(b"".join(chunk))
+            count += len(chunk)
+            chunk = []
+    f.write(b"".join(chunk))
+    count += len(chunk)
+    f.close()
+    return count
+
+class RunFile:
+    """A sorted run of records written by write_run(), memory mapped from
+    disk.
+
+    === Attributes ===
+    file:
+        The name of the file.
+    count:
+        The number of records in the file.
+
+    === Private attributes ===
+    size:
+        The number of bytes of one record.
+    shift:
+        The number of bits of the packed board below the canonical form
+        in a record.
+    mm:
+        The memory map of the file, or None if it is empty.
+    """
+    file: str
+    count: int
+    size: int
+    shift: int
+    mm: Optional[mmap.mmap]
+
+    def __init__(self, file: str, size: int) -> None:
+        """Load the run file stored in <file>, with records of <size>
+        bytes.
+        """
+        self.file = file
+        self.size = size
+        self.shift = 4 * size
+        self.count = os.path.getsize(file) // size
+        self.mm = None
+        if self.count > 0:
+            f = open(file, 'rb')
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            f.close()
+
+    def record(self, i: int) -> int:
+        """Return the record at index <i>."""
+        return int.from_bytes(self.mm[i * self.size:(i + 1) * self.size],
+                              "big")
+
+    def __iter__(self) -> Iterator[int]:
+        """Return an iterator over the records, in order."""
+        return (self.record(i) for i in range(self.count))
+
+    def __contains__(self, key: int) -> bool:
+        """Return whether a record has the canonical form <key>, by binary
+        search.
+        """
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle) >> self.shift < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self.count and self.record(low) >> self.shift == key
+
+    def close(self) -> None:
+        """Unmap and delete the file."""
+        if self.mm is not None:
+            self.mm.close()
+        os.remove(self.file)
+
+# A helper function for external_BFS().
+def spill(directory: str, name: str, records: List[int], size: int,
+          shift: int, files: List[str]) -> RunFile:
+    """Sort <records>, write them without duplicate canonical forms to the
+    run file <name> in <directory> and return it. The name of the file is
+    appended to <files> before it is written.
+    """
+    records.sort()
+    file = os.path.join(directory, name)
+    files.append(file)
+    write_run(file, unique(records, shift), size)
+    return RunFile(file, size)
+
+# Implement a function that performs breadth-first search with its
+# frontier on disk given an initial state and returns a solution.
+def external_BFS(given: Node, directory: str = None, budget: int = 1 << 20,
+                 puzzle: SlidingPuzzle = None, sizes: List[int] = None,
+                 exhaustive: bool = False) -> Node:
+    """Return a Node stored a goal state with a reference of its parent
+    node after a breadth-first search that keeps its layers on disk, in
+    <directory> or a temporary directory, and at most <budget> states in
+    memory. <given> is a state of <puzzle>, or of the Hua Rong Dao puzzle
+    if it is None. The number of states in each layer is appended to
+    <sizes> if it is given. If <exhaustive> is True, every state that can
+    be reached is enumerated and None is returned.
+
+    Each layer is a sorted run file of records without duplicate states.
+    The successors of a layer are buffered in memory and spilled to a
+    sorted run whenever <budget> of them are buffered. The runs are then
+    merged, dropping duplicates and the states of the two layers before,
+    which hold every other state a successor can be in since moves are
+    reversible. The solution path is rebuilt by looking up, layer by
+    layer backward, a successor in the layer before.
+    """
+    successors, test_goal, canonical, _ = puzzle_rules(puzzle)
+    if test_goal(given) and not exhaustive:
+        return given
+    if puzzle is None:
+        width = 8
+    else:
+        width = (puzzle.bits * len(puzzle.labels) + 7) // 8
+    size = 2 * width
+    shift = 8 * width
+    mask = (1 << shift) - 1
+    temporary = directory is None
+    if temporary:
+        directory = tempfile.mkdtemp()
+    else:
+        os.makedirs(directory, exist_ok=True)
+    layers = []
+    runs = []
+    # Every file written, so that those cut short can be deleted too.
+    files = []
+    goal = None
+    depth = 0
+    try:
+        layers.append(spill(directory, "layer0.bin",
+                            [canonical(given.id) << shift | given.id],
+                            size, shift, files))
+        if sizes is not None:
+            sizes.append(1)
+        while goal is None:
+            buffer = []
+            for record in layers[-1]:
+                curr = board_node(record & mask, puzzle)
+                curr.cost = depth
+                for i in successors(curr):
+                    if not exhaustive and test_goal(i):
+                        goal = i
+                        break
+                    buffer.append(canonical(i.id) << shift | i.id)
+                    if len(buffer) >= budget:
+                        runs.append(spill(directory,
+                                          "run{}.bin".format(len(runs)),
+                                          buffer, size, shift, files))
+                        buffer = []
+                if goal is not None:
+                    break
+            if goal is None:
+                runs.append(spill(directory, "run{}.bin".format(len(runs)),
+                                  buffer, size, shift, files))
+                buffer = None
+                file = os.path.join(directory,
+                                    "layer{}.bin".format(depth + 1))
+                files.append(file)
+                count = write_run(file, subtract(
+                    unique(heapq.merge(*runs), shift), layers[-2:], shift),
+                    size)
+                layers.append(RunFile(file, size))
+            for run in runs:
+                run.close()
+            runs = []
+            if goal is None:
+                if count == 0:
+                    return None
+                depth += 1
+                if sizes is not None:
+                    sizes.append(count)
+                if exhaustive and len(layers) > 2:
+                    # Older layers are only needed to rebuild a solution.
+                    layers.pop(-3).close()
+        # Rebuild the path backward from the parent of the goal.
+        path = [goal.id]
+        curr = goal.parent
+        for layer in reversed(layers[:-1]):
+            path.append(curr.id)
+            for i in successors(curr):
+                if canonical(i.id) in layer:
+                    curr = i
+                    break
+        path.append(curr.id)
+        path.reverse()
+        if puzzle is None:
+            apply = relabel(path[0], given.id)
+            path = [apply(board) for board in path]
+        return rebuild(given, path, puzzle)
+    finally:
+        for run in runs + layers:
+            run.close()
+        for file in files:
+            if os.path.exists(file):
+                os.remove(file)
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+def build_table(given: Node, file: str) -> int:
+    """Build the state table for the pieces on the board stored in <given>,
+    write it to <file> and return the number of entries.
+
+    A breadth-first search backward from every goal state finds the cost
+    to a goal of every state from which a goal can be reached, keyed by
+    canonical form. The file format is described in write_distances().
+    """
+    distance = {}
+    layer = goal_states(given)
+    for goal in layer:
+        distance[canonical(goal.id)] = 0
+    d = 0
+    while layer:
+        d += 1
+        nxt = []
+        for curr in layer:
+            for i in successors(curr):
+                key = canonical(i.id)
+                if key not in distance:
+                    distance[key] = d
+                    i.parent = None
+                    nxt.append(i)
+        layer = nxt
+    horizontal, vertical = inventory(given.id)
+    return write_distances(file, TABLE_MAGIC, distance, horizontal, vertical)
+
+class StateTable(DistanceFile):
+    """A state table written by build_table(), memory mapped from disk.
+    The boards in it are canonical forms of states.
+    """
+
+    def __init__(self, file: str) -> None:
+        """Load the state table stored in <file>."""
+        DistanceFile.__init__(self, file, TABLE_MAGIC)
+
+    def solve(self, given: Node) -> Optional[Node]:
+        """Return a Node stored a goal state with a reference of its parent
+        node on an optimal path from <given>, or None if no goal can be
+        reached from <given>.
+
+        Each step moves to a successor whose cost to a goal is one less,
+        so no search is needed.
+        """
+        d = self.lookup(canonical(given.id))
+        if d < 0:
+            return None
+        curr = given
+        while d > 0:
+            for i in successors(curr):
+                if self.lookup(canonical(i.id)) == d - 1:
+                    curr = i
+                    break
+            d -= 1
+        return curr
+
 # A helper function for solution().
 def output(s: str) -> str:
     """Return the representation of a state in a solution. 
@@ -460,10 +2005,10 @@ def output(s: str) -> str:
     s = s.replace('7', '4')
     return s
 
-def solution(file: str, given: Node) -> None:
+def solution(file: str, given: Node, puzzle: SlidingPuzzle = None) -> None:
     """Write the solution into <file> with <given>, which 
-    is the Node storing a goal state and a reference to its
-    parent node.
+    is the Node storing a goal state of <puzzle>, or of the Hua Rong Dao
+    puzzle if it is None, and a reference to its parent node.
     """
     result = Stack()
     curr = given
@@ -473,18 +2018,379 @@ def solution(file: str, given: Node) -> None:
     f = open(file, 'w')
     f.write("Cost of the solution: " + str(cost(given)) +"\n")
     while not result.is_empty():
-        f.write(output(str(result.pop())))
+        if puzzle is None:
+            f.write(output(str(result.pop())))
+        else:
+            f.write(puzzle.output(result.pop()))
         f.write("\n")
     f.close()
     return None
 
+def load_files(given: Node, pdb_file: Optional[str],
+               table_file: Optional[str], strict: bool = True) \
+        -> Tuple[Optional[Callable[[Node], int]], Optional[StateTable]]:
+    """Return the heuristic of the pattern database in <pdb_file> and the
+    state table in <table_file>, or None for either file name that is None.
+    A file built for other pieces than the ones on the board stored in
+    <given> raises ValueError if <strict> is True, and gives None otherwise.
+    """
+    heuristic = None
+    table = None
+    if pdb_file is not None:
+        pdb = PatternDatabase(pdb_file)
+        if (pdb.horizontal, pdb.vertical) == inventory(given.id):
+            heuristic = pdb.heuristic
+        elif strict:
+            raise ValueError(pdb_file + " was built for different pieces")
+    if table_file is not None:
+        table = StateTable(table_file)
+        if (table.horizontal, table.vertical) != inventory(given.id):
+            if strict:
+                raise ValueError(table_file +
+                                 " was built for different pieces")
+            table = None
+    return heuristic, table
+
+def optimal_search(given: Node, search: str = "astar",
+                   heuristic: Callable[[Node], int] = None,
+                   table: StateTable = None,
+                   memory: int = 1 << 18,
+                   stats: SearchStats = None,
+                   weight: float = 2.0,
+                   deadline: float = None,
+                   report: Callable[[Node, float], None] = None,
+                   puzzle: SlidingPuzzle = None,
+                   directory: str = None,
+                   budget: int = 1 << 20) -> Node:
+    """Return a Node stored a goal state with a reference of its parent 
+    node, looked up in <table> if it is given and found by <search>
+    ("astar", "ida", "rbfs", "bidirectional", "weighted", "anytime" or
+    "external") with <heuristic> otherwise.
+
+    <memory> is the number of states IDA* and RBFS may remember, and
+    <stats> records what A* does if it is given. <weight> is the starting
+    weight of weighted and anytime A*, and <deadline> and <report> are
+    passed on to anytime_A_star(). <directory> and <budget> are passed on
+    to external_BFS(). <given> is a state of <puzzle>, or of the Hua Rong Dao
+    puzzle if it is None.
+
+    Raise ValueError if <puzzle> is given with a table or with
+    bidirectional BFS, which only solve the Hua Rong Dao puzzle.
+    """
+    if puzzle is not None and (table is not None or
+                               search == "bidirectional"):
+        raise ValueError("only the 5x4 Hua Rong Dao puzzle supports "
+                         "state tables and bidirectional BFS")
+    if table is not None:
+        return table.solve(given)
+    if search == "ida":
+        return IDA_star(given, heuristic, memory, puzzle)
+    if search == "rbfs":
+        return RBFS(given, heuristic, memory, puzzle)
+    if search == "bidirectional":
+        return bidirectional_BFS(given)
+    if search == "external":
+        return external_BFS(given, directory, budget, puzzle)
+    if search == "weighted":
+        return weighted_A_star(given, heuristic, weight, puzzle)
+    if search == "anytime":
+        return anytime_A_star(given, heuristic, weight, deadline=deadline,
+                              report=report, puzzle=puzzle)
+    return A_star(given, heuristic, stats, puzzle)
+
+# The pattern databases and state tables loaded by a batch worker, by the
+# names of their files.
+loaded = {}
+
+class SearchTimeout(Exception):
+    """Raised in a batch worker when a puzzle runs out of time."""
+    pass
+
+# A helper function for init_worker().
+def alarm(signum: int, frame: Any) -> None:
+    """Signal handler that stops the puzzle being solved."""
+    raise SearchTimeout()
+
+def init_worker(memory_limit: int) -> None:
+    """Set up a batch worker process, capping its address space at
+    <memory_limit> MB if it is positive.
+    """
+    signal.signal(signal.SIGALRM, alarm)
+    if memory_limit > 0:
+        # The resource module is only available on Unix.
+        import resource
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def solve_file(task: Tuple[str, str, argparse.Namespace]) -> dict:
+    """Solve the puzzle in the input file of <task> in a batch worker, write
+    the DFS and optimal solutions to the output directory of <task> and
+    return a row of the summary table.
+
+    The options of <task> are the parsed command line: general, search,
+    heuristic, memory, budget, pdb, table and timeout are used. A pattern
+    database or state table built for other pieces than those of the
+    puzzle is not used for it. External BFS uses a temporary directory of
+    its own in every worker.
+    """
+    file, outdir, options = task
+    name = os.path.splitext(os.path.basename(file))[0]
+    row = {"input": name, "status": "ok", "dfs": "-", "optimal": "-",
+           "seconds": 0.0}
+    begin = time.time()
+    if options.timeout:
+        signal.setitimer(signal.ITIMER_REAL, options.timeout)
+    try:
+        puzzle, start = load_puzzle(file, options.general)
+        heuristic = None
+        table = None
+        if puzzle is None:
+            key = (options.pdb, options.table, inventory(start.id))
+            if key not in loaded:
+                loaded[key] = load_files(start, options.pdb, options.table,
+                                         False)
+            heuristic, table = loaded[key]
+            if heuristic is None and options.heuristic == "advanced":
+                heuristic = advanced_h
+        elif options.pdb is not None:
+            raise ValueError("only the 5x4 Hua Rong Dao puzzle supports "
+                             "pattern databases")
+        dfs_goal = DFS(start, puzzle=puzzle)
+        goal = optimal_search(start, options.search, heuristic, table,
+                              options.memory, weight=options.weight,
+                              deadline=options.deadline, puzzle=puzzle,
+                              budget=options.budget)
+        if dfs_goal is None or goal is None:
+            row["status"] = "unsolved"
+            return row
+        solution(os.path.join(outdir, name + "_dfs.txt"), dfs_goal, puzzle)
+        solution(os.path.join(outdir, name + "_astar.txt"), goal, puzzle)
+    except SearchTimeout:
+        row["status"] = "timeout"
+        return row
+    except MemoryError:
+        row["status"] = "memory"
+        return row
+    except Exception as e:
+        # Any other failure is reported for this puzzle alone.
+        row["status"] = "error: " + (str(e) or type(e).__name__)
+        return row
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        row["seconds"] = time.time() - begin
+    row["dfs"] = cost(dfs_goal)
+    row["optimal"] = cost(goal)
+    return row
+
+# A helper function for batch().
+def batch_inputs(source: str) -> List[str]:
+    """Return the input files in <source>, which is either a directory of
+    hrd_input*.txt files or a manifest listing one input file per line,
+    relative to the manifest.
+    """
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "hrd_input*.txt")))
+    base = os.path.dirname(source)
+    f = open(source)
+    files = [os.path.join(base, line.strip()) for line in f if line.strip()]
+    f.close()
+    return files
+
+# A helper function for batch().
+def summary_line(row: dict) -> str:
+    """Return the line of the summary table for <row>."""
+    return "{:<30} {:<10} {:>8} {:>8} {:>9.2f}".format(
+        row["input"], row["status"], row["dfs"], row["optimal"],
+        row["seconds"])
+
+def batch(source: str, outdir: str, options: argparse.Namespace) \
+        -> List[dict]:
+    """Solve every puzzle in <source> (see batch_inputs()) with a pool of
+    options.jobs processes, writing the solutions to <outdir> as they
+    are found and finally the summary table to <outdir>/summary.txt.
+    Return the rows of the summary table.
+
+    Each puzzle gets at most options.timeout seconds, and each worker at
+    most options.memory_limit MB, if they are positive.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    tasks = [(file, outdir, options) for file in batch_inputs(source)]
+    header = "{:<30} {:<10} {:>8} {:>8} {:>9}".format(
+        "input", "status", "dfs", "optimal", "seconds")
+    print(header, flush=True)
+    rows = []
+    with multiprocessing.Pool(options.jobs, init_worker,
+                              (options.memory_limit,)) as pool:
+        for row in pool.imap_unordered(solve_file, tasks):
+            print(summary_line(row), flush=True)
+            rows.append(row)
+    rows.sort(key=lambda row: row["input"])
+    f = open(os.path.join(outdir, "summary.txt"), 'w')
+    f.write(header + "\n")
+    for row in rows:
+        f.write(summary_line(row) + "\n")
+    solved = sum(1 for row in rows if row["status"] == "ok")
+    f.write("{} of {} puzzles solved\n".format(solved, len(rows)))
+    f.close()
+    return rows
+
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python3 hrd.py  <input file> "
+    parser = argparse.ArgumentParser(
+        usage="python3 hrd.py  <input file> "
               "<DFS output file>  <A* output file> ")
+    parser.add_argument("input")
+    parser.add_argument("dfs_output", nargs="?")
+    parser.add_argument("astar_output", nargs="?")
+    parser.add_argument("--pdb", metavar="FILE",
+                        help="use the pattern database in FILE as the A* "
+                             "heuristic")
+    parser.add_argument("--search",
+                        choices=["astar", "ida", "rbfs", "bidirectional",
+                                 "weighted", "anytime", "external"],
+                        default="astar",
+                        help="the search written to the A* output file: "
+                             "A* (default), IDA*, recursive best-first "
+                             "search, bidirectional BFS, weighted A*, "
+                             "anytime A*, which rewrites the file with every "
+                             "better solution, or BFS with its layers on "
+                             "disk")
+    parser.add_argument("--weight", type=float, default=2.0, metavar="W",
+                        help="the starting heuristic weight of weighted "
+                             "and anytime A* (default %(default)s)")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                        help="the time after which anytime A* returns its "
+                             "best solution")
+    parser.add_argument("--heuristic", choices=["manhattan", "advanced"],
+                        default="manhattan",
+                        help="the heuristic function of the optimal "
+                             "search on a 5x4 board, unless --pdb is given")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="write counters and timers of the DFS and A* "
+                             "searches to FILE as JSON")
+    parser.add_argument("--progress", type=int, default=0, metavar="N",
+                        help="print the progress of the DFS and A* "
+                             "searches to stderr every N expanded nodes")
+    parser.add_argument("--memory", type=int, default=1 << 18,
+                        metavar="N",
+                        help="the number of states IDA* and RBFS may "
+                             "remember to cut off duplicate paths (default "
+                             "%(default)s)")
+    parser.add_argument("--workdir", metavar="DIR",
+                        help="the directory of the disk layers of external "
+                             "BFS (default: a temporary directory)")
+    parser.add_argument("--budget", type=int, default=1 << 20, metavar="N",
+                        help="the number of states external BFS may keep in "
+                             "memory (default %(default)s)")
+    parser.add_argument("--enumerate", action="store_true",
+                        help="count the states that can be reached from the "
+                             "input with external BFS, print the size of "
+                             "every layer and exit")
+    parser.add_argument("--build-pdb", metavar="FILE",
+                        help="build the pattern database for the pieces in "
+                             "the input file, write it to FILE and exit")
+    parser.add_argument("--table", metavar="FILE",
+                        help="write the optimal solution looked up in the "
+                             "state table in FILE to the A* output file")
+    parser.add_argument("--build-table", metavar="FILE",
+                        help="build the state table for the pieces in the "
+                             "input file, write it to FILE and exit")
+    parser.add_argument("--general", action="store_true",
+                        help="solve a plain 5x4 board with the generalized "
+                             "sliding-block engine, which any other board "
+                             "uses")
+    parser.add_argument("--batch", metavar="DIR",
+                        help="solve every puzzle in the input, a directory "
+                             "of hrd_input*.txt files or a manifest listing "
+                             "input files, and write the solutions and a "
+                             "summary table to DIR")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        metavar="N",
+                        help="the number of batch worker processes")
+    parser.add_argument("--timeout", type=float, default=0,
+                        metavar="SECONDS",
+                        help="the time limit per batch puzzle")
+    parser.add_argument("--memory-limit", type=int, default=0, metavar="MB",
+                        help="the memory limit per batch worker")
+    args = parser.parse_args()
+
+    if args.batch is not None:
+        if args.stats is not None or args.progress > 0:
+            parser.error("--stats and --progress cannot be used with --batch")
+        batch(args.input, args.batch, args)
         sys.exit()
 
-    start = start_state(sys.argv[1])
-    solution(sys.argv[2], DFS(start))
-    solution(sys.argv[3], A_star(start))
-    
\ No newline at end of file
+    try:
+        puzzle, start = load_puzzle(args.input, args.general)
+    except ValueError as e:
+        print(e)
+        sys.exit()
+    if puzzle is not None and (args.build_pdb is not None or
+                               args.build_table is not None or
+                               args.pdb is not None or
+                               args.table is not None or
+                               args.search == "bidirectional"):
+        print("only the 5x4 Hua Rong Dao puzzle supports pattern databases, "
+              "state tables and bidirectional BFS")
+        sys.exit()
+    if args.enumerate:
+        sizes = []
+        external_BFS(start, args.workdir, args.budget, puzzle, sizes, True)
+        for depth, count in enumerate(sizes):
+            print(depth, count)
+        print(sum(sizes), "states can be reached")
+        sys.exit()
+    if args.build_pdb is not None:
+        print(build_pdb(start, args.build_pdb), "patterns written to",
+              args.build_pdb)
+        sys.exit()
+    if args.build_table is not None:
+        print(build_table(start, args.build_table), "states written to",
+              args.build_table)
+        sys.exit()
+    if args.astar_output is None:
+        parser.print_usage()
+        sys.exit()
+    if args.search != "astar" and (args.stats is not None or
+                                   args.progress > 0):
+        parser.error("--stats and --progress only record DFS and A*, not "
+                     "--search " + args.search)
+    try:
+        heuristic, table = load_files(start, args.pdb, args.table)
+    except ValueError as e:
+        print(e)
+        sys.exit()
+    if heuristic is None and args.heuristic == "advanced" and puzzle is None:
+        heuristic = advanced_h
+    dfs_stats = None
+    astar_stats = None
+    if args.stats is not None or args.progress > 0:
+        progress = print_progress if args.progress > 0 else None
+        interval = max(args.progress, 1)
+        dfs_stats = SearchStats("dfs", progress, interval)
+        astar_stats = SearchStats(args.search, progress, interval)
+    dfs_goal = DFS(start, dfs_stats, puzzle)
+    if dfs_goal is None:
+        # DFS explores every reachable state, so there is no solution.
+        print("the puzzle in", args.input, "has no solution")
+        sys.exit()
+    solution(args.dfs_output, dfs_goal, puzzle)
+    def report(goal: Node, bound: float) -> None:
+        solution(args.astar_output, goal, puzzle)
+        print("cost {}, at most {:.2f} times the optimal cost".format(
+            cost(goal), bound), file=sys.stderr)
+    goal = optimal_search(start, args.search, heuristic, table, args.memory,
+                          astar_stats, args.weight, args.deadline, report,
+                          puzzle, args.workdir, args.budget)
+    if goal is None:
+        print("the", args.search, "search found no solution")
+        sys.exit()
+    solution(args.astar_output, goal, puzzle)
+    if args.stats is not None:
+        summary = {"dfs": dfs_stats.summary(),
+                   "astar": astar_stats.summary()}
+        summary["dfs"]["cost"] = cost(dfs_goal)
+        summary["astar"]["cost"] = cost(goal)
+        f = open(args.stats, 'w')
+        json.dump(summary, f, indent=2)
+        f.write("\n")
+        f.close()
@@ -1,8 +1,33 @@
 from json.encoder import INFINITY
+import argparse
+import array
+import itertools
+import math
+import mmap
+import multiprocessing
+import os
+import random
+import struct
 import sys
-from typing import List, Tuple
+import time
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
 DEPTH = 10
-explored = {}
+# The largest depth a search may be asked for.
+MAX_DEPTH = 127
+# The number of entries of a transposition table and which entry a new
+# result replaces; see TranspositionTable.
+TABLE_SIZE = 1 << 18
+REPLACEMENT = "depth"
+
+# Zobrist keys: the key of a position is the xor of ZOBRIST[i][j][x] for
+# every square (i, j) holding x, and of BLACK_TO_MOVE if it is black's turn.
+# Empty squares add nothing.
+_random = random.Random(384)
+ZOBRIST = [[{'.': 0, 'r': _random.getrandbits(64),
+             'R': _random.getrandbits(64), 'b': _random.getrandbits(64),
+             'B': _random.getrandbits(64)} for j in range(8)]
+           for i in range(8)]
+BLACK_TO_MOVE = _random.getrandbits(64)
 
 class Position:
     """A Node that stores the player whose turn it is, and the 
@@ -16,6 +41,8 @@ class Position:
         The string representing the player whose turn it is in this position. 
     state:
         The list storing eight lists to represent the position of chess board.
+    key:
+        The Zobrist key of the position, including the player.
 
     === Representation Invariants ===
     - player can only be either 'red' or 'black'.
@@ -25,11 +52,18 @@ class Position:
     """
     player: str
     state: List[list[str]]
+    key: int
     
-    def __init__(self, player: str, state: List[list[str]]) -> None:
-        """Initialize a new Node."""
+    def __init__(self, player: str, state: List[list[str]],
+                 key: int = None) -> None:
+        """Initialize a new Node. <key> is the Zobrist key of the position,
+        computed from <state> if it is not given.
+        """
         self.player = player
         self.state = state
+        if key is None:
+            key = zobrist(player, state)
+        self.key = key
     
     def __str__(self) -> str:
         """The string representation of this position."""
@@ -49,6 +83,18 @@ class Position:
             return True
         return False
 
+def zobrist(player: str, state: List[list[str]]) -> int:
+    """Return the Zobrist key of the position of <state> with <player> to
+    move.
+    """
+    key = 0
+    for i in range(0, 8):
+        for j in range(0, 8):
+            key ^= ZOBRIST[i][j][state[i][j]]
+    if player == "black":
+        key ^= BLACK_TO_MOVE
+    return key
+
 def start(file: str) -> Position:
     """Read in an initial configuration of the chess board from <file>.
     Return the Position storing the start state.
@@ -65,362 +111,1079 @@ def start(file: str) -> Position:
     f.close()
     return Position("red", state)
 
-def red_black_points(p: Position):
+# Pieces stand on 32 squares (i, j) of the board, those whose i + j has the
+# same parity; which parity depends on the input. A bitboard is an int
+# whose bit s is set if square s is in the set, with the 32 squares
+# numbered from left to right, from top to bottom, four per row.
+FULL = (1 << 32) - 1
+ROW0 = 0xF
+ROW7 = 0xF << 28
+# The four directions a piece can move in. Red men move up and black men
+# move down; the opposite of direction d is 3 - d.
+UP_LEFT = 0
+UP_RIGHT = 1
+DOWN_LEFT = 2
+DOWN_RIGHT = 3
+RED_DIRECTIONS = (UP_LEFT, UP_RIGHT)
+BLACK_DIRECTIONS = (DOWN_LEFT, DOWN_RIGHT)
+KING_DIRECTIONS = (UP_LEFT, UP_RIGHT, DOWN_LEFT, DOWN_RIGHT)
+
+class Geometry:
+    """The numbering of the 32 squares of the board that pieces stand on,
+    with the tables and masks that move pieces between them.
+
+    === Attributes ===
+    parity:
+        Pieces stand on the squares (i, j) with (i + j) % 2 == parity.
+    squares:
+        squares[s] is the (row, column) of square s.
+    zobrist:
+        zobrist[s] maps a piece to its Zobrist key on square s.
+    neighbour:
+        neighbour[d][s] is the square next to square s in direction d, or
+        -1 if it is off the board.
+    jump:
+        jump[d][s] is the square two steps from square s in direction d, or
+        -1 if it is off the board.
+    offset:
+        The bitboard of the rows whose first square is in column 1.
+    left:
+        The bitboard of the squares in column 0.
+    right:
+        The bitboard of the squares in column 7.
+    """
+    parity: int
+    squares: List[Tuple[int, int]]
+    zobrist: List[dict]
+    neighbour: List[List[int]]
+    jump: List[List[int]]
+    offset: int
+    left: int
+    right: int
+
+    def __init__(self, parity: int) -> None:
+        """Initialize a new Geometry for the squares of <parity>."""
+        self.parity = parity
+        self.squares = []
+        self.offset = 0
+        for s in range(32):
+            i = s // 4
+            first = (i + parity) % 2
+            self.squares.append((i, 2 * (s % 4) + first))
+            if first:
+                self.offset |= 1 << s
+        self.zobrist = [ZOBRIST[i][j] for i, j in self.squares]
+        self.left = 0
+        self.right = 0
+        for s, (i, j) in enumerate(self.squares):
+            if j == 0:
+                self.left |= 1 << s
+            elif j == 7:
+                self.right |= 1 << s
+        index = {square: s for s, square in enumerate(self.squares)}
+        self.neighbour = []
+        self.jump = []
+        for di, dj in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+            self.neighbour.append([index.get((i + di, j + dj), -1)
+                                   for i, j in self.squares])
+            self.jump.append([index.get((i + 2 * di, j + 2 * dj), -1)
+                              for i, j in self.squares])
+
+    def step(self, bb: int, d: int) -> int:
+        """Return the bitboard of the squares next to the squares of <bb>
+        in direction <d>, by shifting and masking. Squares off the board
+        are dropped.
+        """
+        a = bb & self.offset
+        b = bb & ~self.offset
+        if d == UP_LEFT:
+            return ((a & ~ROW0) >> 4) | ((b & ~ROW0 & ~self.left) >> 5)
+        if d == UP_RIGHT:
+            return ((a & ~ROW0 & ~self.right) >> 3) | ((b & ~ROW0) >> 4)
+        if d == DOWN_LEFT:
+            return ((a & ~ROW7) << 4) | ((b & ~ROW7 & ~self.left) << 3)
+        return ((a & ~ROW7 & ~self.right) << 5) | ((b & ~ROW7) << 4)
+
+GEOMETRIES = [Geometry(0), Geometry(1)]
+
+def squares(bb: int) -> List[int]:
+    """Return the squares of the bitboard <bb> in increasing order."""
+    result = []
+    while bb:
+        low = bb & -bb
+        result.append(low.bit_length() - 1)
+        bb ^= low
+    return result
+
+class Move(NamedTuple):
+    """A move of a piece, which is made and taken back on a Board.
+
+    === Attributes ===
+    start:
+        The square the piece moves from.
+    end:
+        The square the piece moves to.
+    captured:
+        The bitboard of the pieces it captures.
+    captured_kings:
+        The bitboard of the kings among the pieces it captures.
+    king:
+        True if the piece is a king.
+    crowned:
+        True if the piece is a man that becomes a king.
+    """
+    start: int
+    end: int
+    captured: int
+    captured_kings: int
+    king: bool
+    crowned: bool
+
+class Board:
+    """A position of the checkers board stored as 32-square bitboards, which
+    is changed in place by make() and unmake() of a Move.
+
+    === Attributes ===
+    red:
+        The bitboard of the red pieces.
+    black:
+        The bitboard of the black pieces.
+    kings:
+        The bitboard of the kings of both players.
+    player:
+        The player whose turn it is, 'red' or 'black'.
+    key:
+        The Zobrist key of the position, the same as the key of the
+        Position it stands for.
+    geometry:
+        The Geometry of the squares the pieces stand on.
+    material:
+        The points of red player minus those of black player, with each
+        regular piece worth 1 point and each king worth 2.
+    king_balance:
+        The number of red kings minus the number of black kings.
+
+    === Representation Invariants ===
+    - red & black == 0
+    - kings & ~(red | black) == 0
+    - material and king_balance are kept up to date by make() and unmake()
+    """
+    red: int
+    black: int
+    kings: int
+    player: str
+    key: int
+    geometry: Geometry
+    material: int
+    king_balance: int
+
+    def __init__(self, p: Position) -> None:
+        """Initialize a new Board storing the position <p>. Raise
+        ValueError if its pieces stand on squares of both parities.
+        """
+        parities = set()
+        for i in range(0, 8):
+            for j in range(0, 8):
+                if p.state[i][j] in ('r', 'R', 'b', 'B'):
+                    parities.add((i + j) % 2)
+        if len(parities) > 1:
+            raise ValueError("pieces stand on squares of both colours")
+        self.geometry = GEOMETRIES[parities.pop() if parities else 1]
+        self.red = 0
+        self.black = 0
+        self.kings = 0
+        for s, (i, j) in enumerate(self.geometry.squares):
+            x = p.state[i][j]
+            if x in ('r', 'R'):
+                self.red |= 1 << s
+            elif x in ('b', 'B'):
+                self.black |= 1 << s
+            if x in ('R', 'B'):
+                self.kings |= 1 << s
+        self.player = p.player
+        self.key = p.key
+        red, black = red_black_points(self)
+        self.material = red - black
+        self.king_balance = bin(self.red & self.kings).count('1') - \
+            bin(self.black & self.kings).count('1')
+
+    def position(self) -> Position:
+        """Return the Position stored in this Board."""
+        state = [['.'] * 8 for i in range(8)]
+        for s, (i, j) in enumerate(self.geometry.squares):
+            bit = 1 << s
+            if self.red & bit:
+                state[i][j] = 'R' if self.kings & bit else 'r'
+            elif self.black & bit:
+                state[i][j] = 'B' if self.kings & bit else 'b'
+        return Position(self.player, state, self.key)
+
+    def captures(self, s: int, directions: Tuple[int, ...], opp: int,
+                 empty: int, crown: int) -> List[Tuple[int, int]]:
+        """Return the capture sequences of the piece on square <s> moving in
+        <directions>, with the opponent's pieces on <opp> and the empty
+        squares <empty>, as pairs of the square it ends on and the bitboard
+        of the pieces it captures. A sequence ends when no capture follows
+        or when the piece reaches a square of <crown> and becomes a king.
+        """
+        first = []
+        for d in directions:
+            n = self.geometry.neighbour[d][s]
+            end = self.geometry.jump[d][s]
+            if end >= 0 and (opp >> n) & 1 and (empty >> end) & 1:
+                first.append((end, 1 << n))
+        result = []
+        longer = []
+        for end, captured in first:
+            if (crown >> end) & 1:
+                more = []
+            else:
+                more = self.captures(end, directions, opp & ~captured,
+                                     (empty | (1 << s) | captured) &
+                                     ~(1 << end), crown)
+            if not more:
+                result.append((end, captured))
+            for last, others in more:
+                longer.append((last, captured | others))
+        return result + longer
+
+    def has_moves(self) -> bool:
+        """Return True if the player whose turn it is has a legal move,
+        found by shifting whole bitboards without generating any move.
+        """
+        empty = FULL & ~(self.red | self.black)
+        if self.player == "red":
+            own, opp, forward = self.red, self.black, RED_DIRECTIONS
+        else:
+            own, opp, forward = self.black, self.red, BLACK_DIRECTIONS
+        kings = own & self.kings
+        step = self.geometry.step
+        for d in KING_DIRECTIONS:
+            # The squares from which a piece can move or capture in d.
+            behind = step(empty, 3 - d)
+            if (kings if d not in forward else own) & \
+                    (behind | step(opp & behind, 3 - d)):
+                return True
+        return False
+
+    def moves(self) -> List[Move]:
+        """Return the legal moves of the player whose turn it is, in the
+        order generate() yields them.
+        """
+        return list(self.generate())
+
+    def generate(self) -> Iterator[Move]:
+        """Yield the legal moves of the player whose turn it is. Capturing
+        is mandatory, so these are the captures if there are any. Moves are
+        yielded square by square in increasing order, and the moves of a
+        square are only generated when the ones before them are used up.
+        """
+        empty = FULL & ~(self.red | self.black)
+        if self.player == "red":
+            own = self.red
+            opp = self.black
+            forward = RED_DIRECTIONS
+            crown = ROW0
+        else:
+            own = self.black
+            opp = self.red
+            forward = BLACK_DIRECTIONS
+            crown = ROW7
+        kings = own & self.kings
+        step = self.geometry.step
+        # The pieces that can capture or move in some direction.
+        jumpers = 0
+        for d in KING_DIRECTIONS:
+            can = step(opp & step(empty, 3 - d), 3 - d)
+            jumpers |= (kings if d not in forward else own) & can
+        if jumpers:
+            for s in squares(jumpers):
+                king = bool((kings >> s) & 1)
+                if king:
+                    lst = self.captures(s, KING_DIRECTIONS, opp, empty, 0)
+                else:
+                    lst = self.captures(s, forward, opp, empty, crown)
+                for end, captured in lst:
+                    yield Move(s, end, captured, captured & self.kings,
+                               king, not king and bool((crown >> end) & 1))
+            return
+        movers = 0
+        for d in KING_DIRECTIONS:
+            can = step(empty, 3 - d)
+            movers |= (kings if d not in forward else own) & can
+        for s in squares(movers):
+            king = bool((kings >> s) & 1)
+            for d in (KING_DIRECTIONS if king else forward):
+                end = self.geometry.neighbour[d][s]
+                if end >= 0 and (empty >> end) & 1:
+                    yield Move(s, end, 0, 0, king,
+                               not king and bool((crown >> end) & 1))
+
+    def make(self, move: Move) -> None:
+        """Make <move> on this Board."""
+        start, end, captured, captured_kings, king, crowned = move
+        zobrist = self.geometry.zobrist
+        a = 1 << start
+        b = 1 << end
+        if self.player == "red":
+            self.red = (self.red & ~a) | b
+            self.black &= ~captured
+            man, opp_man, opp_king = 'r', 'b', 'B'
+            sign = 1
+        else:
+            self.black = (self.black & ~a) | b
+            self.red &= ~captured
+            man, opp_man, opp_king = 'b', 'r', 'R'
+            sign = -1
+        own_king = man.upper()
+        if king:
+            self.kings = (self.kings & ~a) | b
+            self.key ^= zobrist[start][own_king] ^ zobrist[end][own_king]
+        else:
+            if crowned:
+                self.kings |= b
+                self.material += sign
+                self.king_balance += sign
+            self.key ^= zobrist[start][man] ^ \
+                zobrist[end][own_king if crowned else man]
+        if captured:
+            self.kings &= ~captured_kings
+            for s in squares(captured):
+                if (captured_kings >> s) & 1:
+                    self.key ^= zobrist[s][opp_king]
+                    self.material += 2 * sign
+                    self.king_balance += sign
+                else:
+                    self.key ^= zobrist[s][opp_man]
+                    self.material += sign
+        self.key ^= BLACK_TO_MOVE
+        self.player = "black" if self.player == "red" else "red"
+
+    def unmake(self, move: Move) -> None:
+        """Take back <move>, which was the last move made on this Board."""
+        start, end, captured, captured_kings, king, crowned = move
+        zobrist = self.geometry.zobrist
+        self.player = "black" if self.player == "red" else "red"
+        a = 1 << start
+        b = 1 << end
+        if self.player == "red":
+            self.red = (self.red & ~b) | a
+            self.black |= captured
+            man, opp_man, opp_king = 'r', 'b', 'B'
+            sign = 1
+        else:
+            self.black = (self.black & ~b) | a
+            self.red |= captured
+            man, opp_man, opp_king = 'b', 'r', 'R'
+            sign = -1
+        own_king = man.upper()
+        if king:
+            self.kings = (self.kings & ~b) | a
+            self.key ^= zobrist[start][own_king] ^ zobrist[end][own_king]
+        else:
+            if crowned:
+                self.kings &= ~b
+                self.material -= sign
+                self.king_balance -= sign
+            self.key ^= zobrist[start][man] ^ \
+                zobrist[end][own_king if crowned else man]
+        if captured:
+            self.kings |= captured_kings
+            for s in squares(captured):
+                if (captured_kings >> s) & 1:
+                    self.key ^= zobrist[s][opp_king]
+                    self.material -= 2 * sign
+                    self.king_balance -= sign
+                else:
+                    self.key ^= zobrist[s][opp_man]
+                    self.material -= sign
+        self.key ^= BLACK_TO_MOVE
+
+def red_black_points(b: Board):
     """Return the points for red player and black players respectively,
     with each regular piece worth 1 point and each king worth 2.
     """
-    red = 0
-    black = 0
-    for i in p.state:
-        red += i.count('r')
-        red += i.count('R') * 2
-        black += i.count('b')
-        black += i.count('B') * 2
+    red = bin(b.red).count('1') + bin(b.red & b.kings).count('1')
+    black = bin(b.black).count('1') + bin(b.black & b.kings).count('1')
     return red, black
 
-def utility(p: Position) -> int:
+def utility(b: Board) -> int:
     """Return the utility of a game board state for red player, i.e., the
     number of red pieces minus the number of black pieces.
     """
-    red, black = red_black_points(p)
-    return red - black
+    return b.material
 
-def copy_state(given: Position) -> list:
-    """Return a copy of the state stored in <given>.
+def successors(p: Position) -> List[Position]:
+    """Return a list of results after all legal moves for
+    <p>.player in position <p>.state.
     """
-    new_state = []
-    for i in given.state:
-        new_state.append(i[:])
-    return new_state
+    b = Board(p)
+    lst = []
+    for move in b.moves():
+        b.make(move)
+        lst.append(b.position())
+        b.unmake(move)
+    return lst
 
-def red_capture(p: Position, i: int, j: int) -> \
-    List[Tuple[Position, int, int]]:
+def terminal(b: Board) -> bool:
+    """Return True is the game is over in the position <b>.
     """
-    Return a list of Tuple consisting of possible new Position, and the
-    coordinates of the red piece which is originally at <p>.state[<i>][<j>]
-    after this piece captures other pieces if avaliable.
+    return b.red == 0 or b.black == 0 or not b.has_moves()
+
+# The kinds of values stored in a transposition table.
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+class TranspositionTable:
+    """A fixed-size table of alpha-beta search results, indexed by the low
+    bits of the Zobrist keys of positions.
+
+    Each entry holds the key, the remaining depth searched, whether the
+    value is exact or a lower or upper bound (EXACT, LOWER or UPPER) on
+    red player's value, the value, and the best move found, packed by
+    encode_move(). A new result for a position with a different key in the same entry
+    replaces it if the replacement policy allows: "always" replaces every
+    entry, "depth" only entries searched no deeper than the new result.
+
+    === Attributes ===
+    size:
+        The number of entries, a power of 2.
+    policy:
+        The replacement policy, "always" or "depth".
+
+    === Private attributes ===
+    keys:
+        keys[n] is the key stored in entry n, 0 if the entry is empty.
+    depths:
+        depths[n] is the remaining depth of entry n.
+    flags:
+        flags[n] is the kind of the value of entry n.
+    values:
+        values[n] is the value of entry n.
+    moves:
+        moves[n] is the packed best move of entry n, 0 if none.
     """
-    result = []
-    temp = []
-    if (i in range(2, 8) and j in range(2, 8)) and \
-        (p.state[i-1][j-1] == 'b' or p.state[i-1][j-1] == 'B') and \
-            p.state[i-2][j-2] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i-1][j-1] = '.'
-            if i == 2:
-                new_state[i-2][j-2] = 'R'
-            else:
-                new_state[i-2][j-2] = 'r'
-            temp.append((Position("red", new_state), i-2, j-2))
-    if (i in range(2, 8) and j in range(0, 6)) and \
-        (p.state[i-1][j+1] == 'b' or p.state[i-1][j+1] == 'B') and \
-            p.state[i-2][j+2] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i-1][j+1] = '.'
-            if i == 2:
-                new_state[i-2][j+2] = 'R'
-            else:
-                new_state[i-2][j+2] = 'r'
-            temp.append((Position("red", new_state), i-2, j+2))
-    for item in temp:
-        lst = red_capture(item[0], item[1], item[2])
-        if len(lst) == 0:
-            result.append(item)
-        else:
-            temp += lst
-    return result
+    size: int
+    policy: str
+    keys: array.array
+    depths: array.array
+    flags: array.array
+    values: array.array
+    moves: array.array
+
+    def __init__(self, size: int = TABLE_SIZE,
+                 policy: str = REPLACEMENT) -> None:
+        """Initialize a new empty TranspositionTable with <size> entries,
+        rounded down to a power of 2, and the replacement <policy>.
+        """
+        if policy not in ("always", "depth"):
+            raise ValueError("unknown replacement policy " + policy)
+        self.size = 1 << (max(size, 1).bit_length() - 1)
+        self.policy = policy
+        self.keys = array.array('Q', bytes(8 * self.size))
+        self.depths = array.array('h', bytes(2 * self.size))
+        self.flags = array.array('b', bytes(self.size))
+        self.values = array.array('i', bytes(4 * self.size))
+        self.moves = array.array('Q', bytes(8 * self.size))
+
+    def probe(self, key: int) -> Optional[Tuple[int, int, int, int]]:
+        """Return the remaining depth, kind of value, value and packed best
+        move stored for the position with <key>, or None if the position
+        is not stored.
+        """
+        n = key & (self.size - 1)
+        if self.keys[n] != key:
+            return None
+        return self.depths[n], self.flags[n], self.values[n], self.moves[n]
+
+    def store(self, key: int, depth: int, flag: int, value: int,
+              move: int) -> None:
+        """Store the result of a search of the position with <key> to the
+        remaining <depth>, unless the replacement policy keeps the entry
+        already there.
+        """
+        n = key & (self.size - 1)
+        if self.policy == "depth" and self.keys[n] != key and \
+            self.keys[n] != 0 and self.depths[n] > depth:
+            return
+        self.keys[n] = key
+        self.depths[n] = depth
+        self.flags[n] = flag
+        self.values[n] = value
+        self.moves[n] = move
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        for n in range(self.size):
+            self.keys[n] = 0
+
+class SearchTimeout(Exception):
+    """Raised by search() when its SearchLimits run out."""
 
-def black_capture(p: Position, i: int, j: int) -> \
-    List[Tuple[Position, int, int]]:
+class SearchLimits:
+    """The wall-clock time and the number of nodes a search may use.
+
+    === Attributes ===
+    deadline:
+        The time.monotonic() time at which the search stops, or None if
+        the time is unlimited.
+    max_nodes:
+        The number of nodes after which the search stops, or None if it is
+        unlimited.
+    nodes:
+        The number of nodes searched so far.
+    horizon:
+        True if the search has valued a position at the search depth, or
+        taken a value from the transposition table, which may have been.
     """
-    Return a list of Tuple consisting of possible new Position, and the
-    coordinates of the black piece which is originally at <p>.state[<i>][<j>]
-    after this piece captures other pieces if avaliable.
+    deadline: Optional[float]
+    max_nodes: Optional[int]
+    nodes: int
+    horizon: bool
+
+    def __init__(self, seconds: Optional[float] = None,
+                 max_nodes: Optional[int] = None) -> None:
+        """Initialize new SearchLimits of <seconds> from now and <max_nodes>
+        nodes, either of which may be None.
+        """
+        self.deadline = None if seconds is None else time.monotonic() + seconds
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.horizon = False
+
+    def count(self) -> None:
+        """Count a node searched and raise SearchTimeout if the limits have
+        run out. The clock is read every 256 nodes only.
+        """
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchTimeout
+        if self.deadline is not None and self.nodes % 256 == 0 and \
+                time.monotonic() >= self.deadline:
+            raise SearchTimeout
+
+# The scores by which MoveOrdering ranks moves: captures by the points they
+# take, then moves that crown a man, then the two killer moves of the ply,
+# then the rest by their history.
+CAPTURE_SCORE = 1 << 40
+CROWN_SCORE = 1 << 36
+KILLER_SCORES = (1 << 34, 1 << 33)
+
+class MoveOrdering:
+    """Orders the moves of a search from what it has learned so far, without
+    making them or evaluating the positions they lead to.
+
+    === Attributes ===
+    killers:
+        killers[ply] lists the last two moves that caused a cutoff at that
+        ply without capturing, the latest first.
+    history:
+        history[0] and history[1] give, for red and black respectively, the
+        sum of the squared depths of the cutoffs caused by a move without
+        capturing, at index 32 * start + end.
     """
-    result = []
-    temp = []
-    if (i in range(0, 6) and j in range(2, 8)) and \
-        (p.state[i+1][j-1] == 'r' or p.state[i+1][j-1] == 'R') and \
-            p.state[i+2][j-2] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i+1][j-1] = '.'
-            if i == 5:
-                new_state[i+2][j-2] = 'B'
-            else:
-                new_state[i+2][j-2] = 'b'
-            temp.append((Position("black", new_state), i+2, j-2))
-    if (i in range(0, 6) and j in range(0, 6)) and \
-        (p.state[i+1][j+1] == 'r' or p.state[i+1][j+1] == 'R') and \
-            p.state[i+2][j+2] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i+1][j+1] = '.'
-            if i == 5:
-                new_state[i+2][j+2] = 'B'
-            else:
-                new_state[i+2][j+2] = 'b'
-            temp.append((Position("black", new_state), i+2, j+2))
-    for item in temp:
-        lst = black_capture(item[0], item[1], item[2])
-        if len(lst) == 0:
-            result.append(item)
-        else:
-            temp += lst
+    killers: List[List[Move]]
+    history: List[List[int]]
+
+    def __init__(self) -> None:
+        """Initialize a new MoveOrdering that has learned nothing."""
+        self.killers = []
+        self.history = [[0] * 1024, [0] * 1024]
+
+    def clear(self) -> None:
+        """Forget all killer moves and history."""
+        self.__init__()
+
+    def order(self, b: Board, moves: Iterator[Move], ply: int) -> List[Move]:
+        """Return <moves> of <b> at <ply>, sorted from the most to the least
+        promising.
+        """
+        history = self.history[0 if b.player == "red" else 1]
+        killers = self.killers[ply] if ply < len(self.killers) else []
+
+        def score(move: Move) -> int:
+            if move.captured:
+                return CAPTURE_SCORE * (bin(move.captured).count('1') +
+                                        bin(move.captured_kings).count('1'))
+            value = history[32 * move.start + move.end]
+            if move.crowned:
+                value += CROWN_SCORE
+            if move in killers:
+                value += KILLER_SCORES[killers.index(move)]
+            return value
+        return sorted(moves, key=score, reverse=True)
+
+    def cutoff(self, b: Board, move: Move, depth: int, ply: int) -> None:
+        """Learn that <move> of <b> at <ply>, searched to the remaining
+        <depth>, caused a cutoff.
+        """
+        if move.captured:
+            # Captures are mandatory, so they never compete with other moves.
+            return
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        history = self.history[0 if b.player == "red" else 1]
+        history[32 * move.start + move.end] += depth * depth
+
+# Endgame tablebases store, for every position with few pieces, whether the
+# player to move wins, loses or draws, and in how many moves. A byte of 0
+# is a position that is not stored, 1 a draw and d + 2 a win or loss in d
+# moves: the player to move wins if d is odd and loses if d is even.
+TABLEBASE_MAGIC = b"CHKTB001"
+# A tablebase file starts with the magic string, the largest number of
+# pieces and the number of slices, followed by the counts of red men, red
+# kings, black men and black kings and the offset of the bytes of every
+# slice.
+TABLEBASE_HEADER = struct.Struct("=8sHH")
+SLICE_ENTRY = struct.Struct("=BBBBQ")
+# The value of a won position is WIN less the number of moves to the win.
+WIN = 1000
+# The most pieces a tablebase can be built for: three take half a minute,
+# four about 25 minutes and 190 MB, five would take days.
+MAX_PIECES = 4
+BINOMIAL = [[math.comb(n, k) for k in range(33)] for n in range(33)]
+
+def rank(bb: int) -> int:
+    """Return the index of the set of squares <bb> among the sets of as
+    many squares, in colexicographic order.
+    """
+    result = 0
+    k = 0
+    while bb:
+        low = bb & -bb
+        k += 1
+        result += BINOMIAL[low.bit_length() - 1][k]
+        bb ^= low
     return result
 
-def king_capture(p: Position, i: int, j: int) -> \
-    List[Tuple[Position, int, int]]:
+def mirror(bb: int) -> int:
+    """Return the bitboard <bb> reflected left to right, which moves it from
+    one Geometry to the other: square 4 * row + k becomes 4 * row + 3 - k.
     """
-    Return a list of Tuple consisting of possible new Position, and the
-    coordinates of the king piece which is originally at <p>.state[<i>][<j>]
-    after this piece captures other pieces if avaliable.
+    result = 0
+    for s in squares(bb):
+        result |= 1 << (s ^ 3)
+    return result
+
+def board_of(red: int, black: int, kings: int, player: str,
+             geometry: Geometry) -> Board:
+    """Return a new Board with the pieces on the bitboards <red>, <black>
+    and <kings> of <geometry>, and <player> to move.
+    """
+    b = Board.__new__(Board)
+    b.red = red
+    b.black = black
+    b.kings = kings
+    b.player = player
+    b.geometry = geometry
+    b.key = BLACK_TO_MOVE if player == "black" else 0
+    for s in squares(red | black):
+        man = 'r' if (red >> s) & 1 else 'b'
+        b.key ^= geometry.zobrist[s][man.upper() if (kings >> s) & 1 else man]
+    red_points, black_points = red_black_points(b)
+    b.material = red_points - black_points
+    b.king_balance = bin(red & kings).count('1') - \
+        bin(black & kings).count('1')
+    return b
+
+def material_of(b: Board) -> Tuple[int, int, int, int]:
+    """Return the numbers of red men, red kings, black men and black kings
+    of <b>.
+    """
+    return (bin(b.red & ~b.kings).count('1'), bin(b.red & b.kings).count('1'),
+            bin(b.black & ~b.kings).count('1'),
+            bin(b.black & b.kings).count('1'))
+
+def slice_size(counts: Tuple[int, int, int, int]) -> int:
+    """Return the number of bytes of the slice of <counts>."""
+    rm, rk, bm, bk = counts
+    return 2 * BINOMIAL[28][rm] * BINOMIAL[32 - rm][rk] * \
+        BINOMIAL[32 - rm - rk][bm] * BINOMIAL[32 - rm - rk - bm][bk]
+
+def slice_index(b: Board) -> int:
+    """Return the index of <b> in the slice of its material. The red men
+    are ranked among the 28 squares outside row 0, the red kings among the
+    squares the red men leave free, the black men among those the red
+    pieces leave free and the black kings among the rest.
+    """
+    red_men = b.red & ~b.kings
+    index = rank(red_men >> 4)
+    used = red_men
+    for bb in (b.red & b.kings, b.black & ~b.kings, b.black & b.kings):
+        # rank() of bb with the squares of used taken out of the numbering.
+        k = 0
+        ranked = 0
+        rest = bb
+        while rest:
+            low = rest & -rest
+            k += 1
+            ranked += BINOMIAL[low.bit_length() - 1 -
+                               bin(used & (low - 1)).count('1')][k]
+            rest ^= low
+        index = index * BINOMIAL[32 - bin(used).count('1')][k] + ranked
+        used |= bb
+    return 2 * index + (b.player == "black")
+
+def slices(pieces: int) -> List[Tuple[int, int, int, int]]:
+    """Return the materials of the positions with at most <pieces> pieces
+    and at least one of each player, in the order they must be built in:
+    a capture leads to fewer pieces and a man crowned to fewer men.
     """
-    if p.player == "red":
-        king = 'R'
-        opp = 'b'
-        opp_king = 'B'
-    else:
-        king = 'B'
-        opp = 'r'
-        opp_king = 'R'
     result = []
-    temp = []
-    if (i in range(2, 8) and j in range(2, 8)) and \
-        (p.state[i-1][j-1] == opp or p.state[i-1][j-1] == opp_king) and \
-            p.state[i-2][j-2] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i-1][j-1] = '.'
-            new_state[i-2][j-2] = king
-            temp.append((Position(p.player, new_state), i-2, j-2))
-    if (i in range(2, 8) and j in range(0, 6)) and \
-        (p.state[i-1][j+1] == opp or p.state[i-1][j+1] == opp_king) and \
-            p.state[i-2][j+2] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i-1][j+1] = '.'
-            new_state[i-2][j+2] = king
-            temp.append((Position(p.player, new_state), i-2, j+2))
-    if (i in range(0, 6) and j in range(2, 8)) and \
-        (p.state[i+1][j-1] == opp or p.state[i+1][j-1] == opp_king) and \
-            p.state[i+2][j-2] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i+1][j-1] = '.'
-            new_state[i+2][j-2] = king
-            temp.append((Position(p.player, new_state), i+2, j-2))
-    if (i in range(0, 6) and j in range(0, 6)) and \
-        (p.state[i+1][j+1] == opp or p.state[i+1][j+1] == opp_king) and \
-            p.state[i+2][j+2] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i+1][j+1] = '.'
-            new_state[i+2][j+2] = king
-            temp.append((Position(p.player, new_state), i+2, j+2))
-    for item in temp:
-        lst = king_capture(item[0], item[1], item[2])
-        if len(lst) == 0:
-            result.append(item)
-        else:
-            temp += lst
+    for rm in range(pieces + 1):
+        for rk in range(pieces + 1):
+            for bm in range(pieces + 1):
+                for bk in range(pieces + 1):
+                    if rm + rk and bm + bk and rm + rk + bm + bk <= pieces:
+                        result.append((rm, rk, bm, bk))
+    result.sort(key=lambda counts: (sum(counts), counts[0] + counts[2]))
     return result
 
-def red_move(p: Position, i: int, j: int) -> List[Position]:
+def slice_boards(counts: Tuple[int, int, int, int]) -> Iterator[Board]:
+    """Yield a Board of GEOMETRIES[1] for every position of the material
+    <counts>, with either player to move. Red men never stand on row 0 and
+    black men never on row 7, where they would have been crowned.
     """
-    Return a list of Tuple consisting of possible new Position, and the
-    coordinates of the red piece which is originally at <p>.state[<i>][<j>]
-    after this piece move to an empty space if avaliable.
+    rm, rk, bm, bk = counts
+    geometry = GEOMETRIES[1]
+    for red_men in itertools.combinations(range(4, 32), rm):
+        used = set(red_men)
+        for red_kings in itertools.combinations(
+                [s for s in range(32) if s not in used], rk):
+            used2 = used | set(red_kings)
+            for black_men in itertools.combinations(
+                    [s for s in range(28) if s not in used2], bm):
+                used3 = used2 | set(black_men)
+                for black_kings in itertools.combinations(
+                        [s for s in range(32) if s not in used3], bk):
+                    red = sum(1 << s for s in red_men + red_kings)
+                    black = sum(1 << s for s in black_men + black_kings)
+                    kings = sum(1 << s for s in red_kings + black_kings)
+                    for player in ("red", "black"):
+                        yield board_of(red, black, kings, player, geometry)
+
+def build_slice(counts: Tuple[int, int, int, int],
+                built: dict) -> bytearray:
+    """Return the bytes of the slice of <counts> by retrograde analysis,
+    given the bytes of the slices <built> before it, keyed by material.
+
+    Every position is linked to the positions before it in the slice. The
+    positions are then solved by increasing distance: a position is won in
+    d + 1 moves once a move to a position lost in d moves is known, and
+    lost in d + 1 moves once all of its moves lead to won positions, the
+    last of them won in d moves. Positions left unsolved are drawn.
     """
-    lst = []
-    if (i in range(1, 8) and j in range(1, 8)) and \
-        p.state[i-1][j-1] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            if i == 1:
-                new_state[i-1][j-1] = 'R'
-            else:
-                new_state[i-1][j-1] = 'r'
-            lst.append(Position("black", new_state))
-    if (i in range(1, 8) and j in range(0, 7)) and \
-        p.state[i-1][j+1] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            if i == 1:
-                new_state[i-1][j+1] = 'R'
+    size = slice_size(counts)
+    values = bytearray(size)
+    # remaining[index] is the number of moves of a position not yet known
+    # to lead to a won position.
+    remaining = bytearray(size)
+    # The moves within the slice, as the indices of the positions they lead
+    # to and of the positions they are made in.
+    children = array.array('I')
+    parents = array.array('I')
+    # solved[d] lists the positions of the slice solved with distance d and
+    # events[d] the positions with a move to a position of distance d.
+    solved = [[]]
+    events = [[]]
+
+    def add(lst: List[List[int]], d: int, index: int) -> None:
+        while len(lst) <= d:
+            lst.append([])
+        lst[d].append(index)
+
+    for b in slice_boards(counts):
+        index = slice_index(b)
+        moves = b.moves()
+        remaining[index] = len(moves)
+        values[index] = 1
+        if not moves:
+            values[index] = 2
+            solved[0].append(index)
+        for move in moves:
+            b.make(move)
+            if b.red == 0 or b.black == 0:
+                events[0].append(index)
             else:
-                new_state[i-1][j+1] = 'r'
-            lst.append(Position("black", new_state))
-    return lst
+                child = material_of(b)
+                if child == counts:
+                    children.append(slice_index(b))
+                    parents.append(index)
+                else:
+                    value = built[child][slice_index(b)]
+                    if value > 1:
+                        add(events, value - 2, index)
+            b.unmake(move)
+    # Sort the parents by child: those of child c are
+    # by_child[first[c]:first[c + 1]].
+    counted = array.array('I', bytes(4 * (size + 1)))
+    for child in children:
+        counted[child + 1] += 1
+    first = array.array('I', itertools.accumulate(counted))
+    fill = array.array('I', first)
+    by_child = array.array('I', bytes(4 * len(parents)))
+    for child, index in zip(children, parents):
+        by_child[fill[child]] = index
+        fill[child] += 1
+    del children, parents, counted, fill
+    d = 0
+    while d < len(solved) or d < len(events):
+        if d < len(solved):
+            for child in solved[d]:
+                for index in by_child[first[child]:first[child + 1]]:
+                    add(events, d, index)
+        for index in events[d] if d < len(events) else []:
+            if values[index] > 1:
+                continue
+            remaining[index] -= 1
+            if d % 2 == 0 or remaining[index] == 0:
+                values[index] = d + 3
+                add(solved, d + 1, index)
+        d += 1
+    return values
 
-def black_move(p: Position, i: int, j: int) -> List[Position]:
+def build_tablebase(file: str, pieces: int) -> None:
+    """Build the tablebase of the positions with at most <pieces> pieces and
+    write it to <file>.
     """
-    Return a list of Tuple consisting of possible new Position, and the
-    coordinates of the black piece which is originally at <p>.state[<i>][<j>]
-    after this piece move to an empty space if avaliable.
+    built = {}
+    for counts in slices(pieces):
+        built[counts] = build_slice(counts, built)
+    f = open(file, 'wb')
+    f.write(TABLEBASE_HEADER.pack(TABLEBASE_MAGIC, pieces, len(built)))
+    offset = TABLEBASE_HEADER.size + SLICE_ENTRY.size * len(built)
+    for counts, values in built.items():
+        f.write(SLICE_ENTRY.pack(*counts, offset))
+        offset += len(values)
+    for values in built.values():
+        f.write(values)
+    f.close()
+
+class Tablebase:
+    """An endgame tablebase written by build_tablebase(), memory mapped from
+    disk.
+
+    === Attributes ===
+    file:
+        The file the tablebase is stored in.
+    pieces:
+        The largest number of pieces of the positions in the tablebase.
+
+    === Private attributes ===
+    mm:
+        The memory map of the file.
+    slices:
+        slices[counts] is the offset in the file of the slice of the
+        material <counts>.
     """
-    lst = []
-    if (i in range(0, 7) and j in range(1, 8)) and \
-        p.state[i+1][j-1] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            if i == 6:
-                new_state[i+1][j-1] = 'B'
-            else:
-                new_state[i+1][j-1] = 'b'
-            lst.append(Position("red", new_state))
-    if (i in range(0, 7) and j in range(0, 7)) and \
-        p.state[i+1][j+1] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            if i == 6:
-                new_state[i+1][j+1] = 'B'
-            else:
-                new_state[i+1][j+1] = 'b'
-            lst.append(Position("red", new_state))
-    return lst
+    file: str
+    pieces: int
+    mm: mmap.mmap
+    slices: dict
+
+    def __init__(self, file: str) -> None:
+        """Load the tablebase stored in <file>."""
+        self.file = file
+        f = open(file, 'rb')
+        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        magic, self.pieces, n = TABLEBASE_HEADER.unpack_from(self.mm)
+        if magic != TABLEBASE_MAGIC:
+            raise ValueError(file + " is not a checkers tablebase")
+        self.slices = {}
+        for i in range(n):
+            entry = SLICE_ENTRY.unpack_from(
+                self.mm, TABLEBASE_HEADER.size + i * SLICE_ENTRY.size)
+            self.slices[entry[:4]] = entry[4]
+
+    def probe(self, b: Board) -> Optional[int]:
+        """Return red player's value for <b>, WIN less the number of moves
+        to a win, its negation for a loss or 0 for a draw, or None if <b> is
+        not in the tablebase.
+        """
+        if bin(b.red | b.black).count('1') > self.pieces or \
+                b.red & ~b.kings & ROW0 or b.black & ~b.kings & ROW7:
+            return None
+        offset = self.slices.get(material_of(b))
+        if offset is None:
+            return None
+        if b.geometry is not GEOMETRIES[1]:
+            b = board_of(mirror(b.red), mirror(b.black), mirror(b.kings),
+                         b.player, GEOMETRIES[1])
+        value = self.mm[offset + slice_index(b)]
+        if value == 0:
+            return None
+        if value == 1:
+            return 0
+        d = value - 2
+        value = WIN - d if d % 2 else d - WIN
+        return value if b.player == "red" else -value
+
+# The transposition tables of alpha_beta() and advanced_alpha_beta(), whose
+# values are computed differently.
+utility_table = TranspositionTable()
+table = TranspositionTable()
+# The move ordering of advanced_alpha_beta().
+ordering = MoveOrdering()
+# The endgame tablebase advanced_alpha_beta() looks positions up in, if any.
+tablebase = None
 
-def king_move(p: Position, i: int, j: int) -> List[Position]:
+def encode_move(move: Move) -> int:
+    """Return <move> packed into an int for a transposition table, which is
+    never 0.
     """
-    Return a list of Tuple consisting of possible new Position, and the
-    coordinates of the king piece which is originally at <p>.state[<i>][<j>]
-    after this piece move to an empty space if avaliable.
+    return move[0] | (move[1] << 5) | (move[2] << 10) | (1 << 42)
+
+def hash_move_first(moves: List[Move], code: int) -> List[Move]:
+    """Return <moves> with the move packed into <code>, the best move
+    stored in a transposition table, moved to the front.
     """
-    if p.player == "red":
-        opp = "black"
-        king = 'R'
-    else:
-        opp = "red"
-        king = 'B'
-    lst = []
-    if (i in range(1, 8) and j in range(1, 8)) and \
-        p.state[i-1][j-1] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i-1][j-1] = king
-            lst.append(Position(opp, new_state))
-    if (i in range(1, 8) and j in range(0, 7)) and \
-        p.state[i-1][j+1] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i-1][j+1] = king
-            lst.append(Position(opp, new_state))
-    if (i in range(0, 7) and j in range(1, 8)) and \
-        p.state[i+1][j-1] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i+1][j-1] = king
-            lst.append(Position(opp, new_state))
-    if (i in range(0, 7) and j in range(0, 7)) and \
-        p.state[i+1][j+1] == '.':
-            new_state = copy_state(p)
-            new_state[i][j] = '.'
-            new_state[i+1][j+1] = king
-            lst.append(Position(opp, new_state))
-    return lst
+    for n in range(len(moves)):
+        if encode_move(moves[n]) == code:
+            return [moves[n]] + moves[:n] + moves[n + 1:]
+    return moves
 
-def successors(p: Position) -> List[Position]:
-    """Return a list of results after all legal moves for 
-    <p>.player in position <p>.state.
+def store(table: TranspositionTable, b: Board, depth: int, value: int,
+          alpha: int, beta: int, best_move: Optional[Move]) -> None:
+    """Store in <table> the <value> of <b> searched to the remaining <depth>
+    within the window (<alpha>, <beta>), and its <best_move>.
     """
-    lst = []
-    if p.player == "red":
-        for i in range(0, 8):
-            for j in range(0, 8):
-                temp = []
-                if p.state[i][j] == 'r':
-                    temp = red_capture(p, i, j)
-                elif p.state[i][j] == 'R':
-                    temp = king_capture(p, i, j)
-                for item in temp:
-                    new = item[0]
-                    new.player = "black"
-                    lst.append(new)
-        if len(lst) == 0:
-            for i in range(0, 8):
-                for j in range(0, 8):
-                    temp = []
-                    if p.state[i][j] == 'r':
-                        temp = red_move(p, i, j)
-                    elif p.state[i][j] == 'R':
-                        temp = king_move(p, i, j)
-                    for item in temp:
-                        lst.append(item)
+    if value <= alpha:
+        flag = UPPER
+    elif value >= beta:
+        flag = LOWER
     else:
-        for i in range(0, 8):
-            for j in range(0, 8):
-                temp = []
-                if p.state[i][j] == 'b':
-                    temp = black_capture(p, i, j)
-                elif p.state[i][j] == 'B':
-                    temp = king_capture(p, i, j)
-                for item in temp:
-                    new = item[0]
-                    new.player = "red"
-                    lst.append(new)
-        if len(lst) == 0:
-            for i in range(0, 8):
-                for j in range(0, 8):
-                    temp = []
-                    if p.state[i][j] == 'b':
-                        temp = black_move(p, i, j)
-                    elif p.state[i][j] == 'B':
-                        temp = king_move(p, i, j)
-                    for item in temp:
-                        lst.append(item)
-    return lst
+        flag = EXACT
+    move = 0 if best_move is None else encode_move(best_move)
+    table.store(b.key, depth, flag, value, move)
 
-def terminal(p: Position) -> bool:
-    """Return True is the game is over in position <p>.state.
-    """
-    red, black = red_black_points(p)
-    if red == 0 or black == 0:
-        return True
-    if len(successors(p)) == 0:
-        return True
-    return False
+def search(b: Board, alpha: int, beta: int, depth: int,
+           evaluate: Callable[[Board], int], table: TranspositionTable,
+           ordering: Optional[MoveOrdering],
+           limits: Optional[SearchLimits] = None,
+           pv: Optional[List[Move]] = None,
+           ply: int = 0,
+           tablebase: Optional[Tablebase] = None) \
+        -> Tuple[Optional[Move], int]:
+    """Return the best move for <b>.player and red player's value for <b>,
+    searched with alpha-beta pruning to <depth> - 1 more moves. Positions
+    at that depth or at the end of the game are valued by <evaluate>.
+    Results are stored in and looked up in <table>. The moves are sorted
+    by <ordering>, which learns from the cutoffs, unless it is None; <b> is
+    <ply> moves away from the root of the search.
 
-def alpha_beta(p: Position, alpha: int, beta: int, depth: int):
-    """Return the best move for <p>.player and red player's value for <p>.
+    Every node searched is counted by <limits>, which raises SearchTimeout
+    when they run out. The moves of <pv>, a principal variation from <b>,
+    are searched first along it. Positions other than <b> itself that are
+    in <tablebase> get their values from it without being searched.
+
+    The moves are made and taken back on <b> in place. The best move is
+    None if the value is looked up in <table> or if <b> is terminal.
     """
+    if limits is not None:
+        limits.count()
     depth -= 1
     best_move = None
-    if terminal(p) or depth == 0:
-        if best_move is None:
-            best_move = p
-        return best_move, utility(p)
-    if p.player == "red":
+    if tablebase is not None and ply > 0:
+        value = tablebase.probe(b)
+        if value is not None:
+            return best_move, value
+    # The value of a position at the search depth does not depend on
+    # whether the game is over, so its moves are never looked at.
+    if depth == 0 or b.red == 0 or b.black == 0:
+        if depth == 0 and limits is not None:
+            limits.horizon = True
+        return best_move, evaluate(b)
+    old_alpha, old_beta = alpha, beta
+    entry = table.probe(b.key)
+    if entry is not None and entry[0] >= depth:
+        if limits is not None:
+            limits.horizon = True
+        if entry[1] == EXACT:
+            return None, entry[2]
+        if entry[1] == LOWER:
+            alpha = max(alpha, entry[2])
+        else:
+            beta = min(beta, entry[2])
+        if alpha >= beta:
+            return None, entry[2]
+    # The moves are generated once and shared by the test for the end of
+    # the game, the ordering and the loop below. Without ordering they are
+    # generated one at a time, so that a cutoff saves generating the rest.
+    moves = b.generate()
+    first = next(moves, None)
+    if first is None:
+        return best_move, evaluate(b)
+    moves = itertools.chain((first,), moves)
+    if ordering is not None:
+        moves = ordering.order(b, moves, ply)
+    if entry is not None:
+        moves = hash_move_first(list(moves), entry[3])
+    if pv:
+        moves = list(moves)
+        if pv[0] in moves:
+            moves = [pv[0]] + [move for move in moves if move != pv[0]]
+        else:
+            pv = None
+    if b.player == "red":
         value = -INFINITY
     else:
         value = INFINITY
-    for i in successors(p):
-        if str(i.state) in explored:
-            nxt_val = explored[str(i.state)]
-        else:
-            nxt_val = alpha_beta(i, alpha, beta, depth)[1]
-            explored[str(i.state)] = nxt_val
-        if p.player == "red":
+    for n, move in enumerate(moves):
+        b.make(move)
+        nxt_val = search(b, alpha, beta, depth, evaluate, table, ordering,
+                         limits, pv[1:] if pv and n == 0 else None,
+                         ply + 1, tablebase)[1]
+        b.unmake(move)
+        if b.player == "red":
             if value < nxt_val:
-                value, best_move = nxt_val, i
-            if value >= beta:
-                if best_move is None:
-                    best_move = p
-                return best_move, value
+                value, best_move = nxt_val, move
+            cut = value >= beta
             alpha = max(alpha, value)
         else:
             if value > nxt_val:
-                value, best_move = nxt_val, i
-            if value <= alpha:
-                if best_move is None:
-                    best_move = p
-                return best_move, value
+                value, best_move = nxt_val, move
+            cut = value <= alpha
             beta = min(beta, value)
-    if best_move is None:
-        best_move = p
+        if cut:
+            if ordering is not None:
+                ordering.cutoff(b, move, depth, ply)
+            break
+    store(table, b, depth, value, old_alpha, old_beta, best_move)
     return best_move, value
 
+# A helper function for alpha_beta() and advanced_alpha_beta().
+def result(p: Position, b: Board, move: Optional[Move],
+           table: TranspositionTable) -> Position:
+    """Return the Position after <move> is made on <b>, which stores <p>.
+    If <move> is None, the best move stored in <table> is made instead,
+    and <p> itself is returned if there is none.
+    """
+    if move is None:
+        entry = table.probe(b.key)
+        if entry is None or terminal(b):
+            return p
+        moves = hash_move_first(b.moves(), entry[3])
+        if encode_move(moves[0]) != entry[3]:
+            return p
+        move = moves[0]
+    b.make(move)
+    new = b.position()
+    b.unmake(move)
+    return new
+
+def alpha_beta(p: Position, alpha: int, beta: int, depth: int):
+    """Return the best move for <p>.player and red player's value for <p>.
+    """
+    b = Board(p)
+    move, value = search(b, alpha, beta, depth, utility, utility_table, None)
+    return result(p, b, move, utility_table), value
+
 def solution(file: str, p: Position) -> None:
     """Write the solution into <file> with <given>, which 
     is the Position representing the best move.
@@ -430,99 +1193,315 @@ def solution(file: str, p: Position) -> None:
     f.close()
     return None
 
-def heuristic(p: Position) -> int:
-    """Return an advanced heuristic estimate for <p>.state.
+def heuristic(b: Board) -> int:
+    """Return an advanced heuristic estimate for the position <b>.
     """
-    red = 0
-    black = 0
-    for i in range(0, 8):
-        for j in range(0, 8):
-            if p.state[i][j] == 'r' or p.state[i][j] == 'R':
-                if p.state[i][j] == 'r':
-                    red += 1
-                else:
-                    red += 3
-                if j == 0 and i != 7 and (p.state[i+1][1] == 'r' or \
-                    p.state[i+1][1] == 'R'):
-                    red += 1
-                elif j == 7 and i != 7 and (p.state[i+1][6] == 'r' or \
-                    p.state[i+1][6] == 'R'):
-                    red += 1
-                elif i != 7 and j in range(1, 7) and \
-                    (p.state[i+1][j+1] == 'r' or p.state[i+1][j+1] == 'R') \
-                        and (p.state[i+1][j-1] == 'r' or p.state[i+1][j-1] == 'R'):
-                        red += 1
-            elif p.state[i][j] == 'b' or p.state[i][j] == 'B':
-                if p.state[i][j] == 'b':
-                    black += 1
-                else:
-                    black += 3
-                if j == 0 and i != 0 and (p.state[i-1][1] == 'b' or \
-                    p.state[i-1][1] == 'B'):
-                    black += 1
-                elif j == 7 and i != 0 and (p.state[i-1][6] == 'b' or \
-                    p.state[i-1][6] == 'B'):
-                    black += 1
-                elif i != 0 and j in range(1, 7) and \
-                    (p.state[i-1][j+1] == 'b' or p.state[i-1][j+1] == 'B') \
-                        and (p.state[i-1][j-1] == 'b' or p.state[i-1][j-1] == 'B'):
-                        black += 1
-    return red - black
-
-def sort_successors(lst: List[Position]) -> List[Position]:
-    """
-    Return a sorted list for successors.
-    """
-    if len(lst) == 0:
-        return lst
-    if lst[0].player == "red":
-        return sorted(lst, key=lambda Position: heuristic(Position))
-    else:
-        return sorted(lst, key=lambda Position: heuristic(Position))[::-1]
+    step = b.geometry.step
+    left = b.geometry.left
+    right = b.geometry.right
+    # A piece that is not on its own back row is supported if the squares
+    # behind it on both diagonals, those that are on the board, hold
+    # pieces of the same player.
+    red_supported = b.red & ~ROW7 & (step(b.red, UP_RIGHT) | left) & \
+        (step(b.red, UP_LEFT) | right)
+    black_supported = b.black & ~ROW0 & (step(b.black, DOWN_RIGHT) | left) & \
+        (step(b.black, DOWN_LEFT) | right)
+    # Each piece is worth 1, each king 3 and each supported piece 1 more.
+    return b.material + b.king_balance + bin(red_supported).count('1') - \
+        bin(black_supported).count('1')
 
 def advanced_alpha_beta(p: Position, alpha: int, beta: int, depth: int):
     """Return the best move for <p>.player and red player's value for <p>.
     Using heuristic function instead of the utility function given.
     """
-    depth -= 1
-    best_move = None
-    if terminal(p) or depth == 0:
-        if best_move is None:
-            best_move = p
-        return best_move, heuristic(p)
-    if p.player == "red":
-        value = -INFINITY
+    b = Board(p)
+    move, value = search(b, alpha, beta, depth, heuristic, table, ordering,
+                         tablebase=tablebase)
+    return result(p, b, move, table), value
+
+def principal_variation(b: Board, table: TranspositionTable,
+                        length: int) -> List[Move]:
+    """Return the principal variation from <b> of at most <length> moves,
+    following the best moves stored in <table>.
+    """
+    pv = []
+    while len(pv) < length:
+        entry = table.probe(b.key)
+        if entry is None or terminal(b):
+            break
+        moves = hash_move_first(b.moves(), entry[3])
+        if encode_move(moves[0]) != entry[3]:
+            break
+        pv.append(moves[0])
+        b.make(moves[0])
+    for move in reversed(pv):
+        b.unmake(move)
+    return pv
+
+def iterative_deepening(p: Position, depth: int = DEPTH,
+                        seconds: Optional[float] = None,
+                        max_nodes: Optional[int] = None) \
+        -> Tuple[Position, int, int]:
+    """Return the best move for <p>.player, red player's value for <p> and
+    the depth it was searched to, searching advanced_alpha_beta()'s tree to
+    depth 2, 3, ... up to <depth>, at most MAX_DEPTH, until <seconds> or
+    <max_nodes> run out.
+
+    Every iteration searches the principal variation of the one before it
+    first. An iteration cut short by the limits is thrown away, so the move
+    returned is that of the deepest completed iteration; the first
+    iteration, a search of a single move, is always completed. Once an
+    iteration ends every line before the search depth, deeper ones would
+    find the same, so the search stops.
+    """
+    b = Board(p)
+    # The first iteration is only watched for the search depth.
+    limits = SearchLimits()
+    move, value = search(b, -INFINITY, INFINITY, 2, heuristic, table,
+                         ordering, limits, tablebase=tablebase)
+    best = result(p, b, move, table), value, 2
+    pv = principal_variation(b, table, 1)
+    horizon = limits.horizon
+    limits = SearchLimits(seconds, max_nodes)
+    for d in range(3, min(depth, MAX_DEPTH) + 1):
+        if not horizon:
+            break
+        limits.horizon = False
+        try:
+            move, value = search(b, -INFINITY, INFINITY, d, heuristic, table,
+                                 ordering, limits, pv, tablebase=tablebase)
+        except SearchTimeout:
+            break
+        best = result(p, b, move, table), value, d
+        pv = principal_variation(b, table, d - 1)
+        horizon = limits.horizon
+    return best
+
+def search_root_move(task: Tuple[str, List[List[str]], Move, int, int, int,
+                                  bool, Optional[str]]) -> int:
+    """Return red player's value after the move of a task of
+    parallel_search(), run in a worker process.
+
+    The task is (player, state, move, depth, alpha, beta, fresh, file):
+    <move> is made in the position of <player> and <state>, and the result
+    is searched as in advanced_alpha_beta() to <depth> - 1 more moves within
+    the window (<alpha>, <beta>), with the tablebase stored in <file> if it
+    is not None. The worker's transposition table and move ordering are
+    kept from its earlier tasks, unless <fresh> is True.
+    """
+    global tablebase
+    player, state, move, depth, alpha, beta, fresh, file = task
+    if file is not None and (tablebase is None or tablebase.file != file):
+        tablebase = Tablebase(file)
+    if fresh:
+        table.clear()
+        ordering.clear()
+    b = Board(Position(player, state))
+    b.make(move)
+    return search(b, alpha, beta, depth, heuristic, table, ordering,
+                  ply=1, tablebase=tablebase)[1]
+
+def parallel_search(p: Position, depth: int = DEPTH,
+                    jobs: int = os.cpu_count() or 1,
+                    deterministic: bool = False) -> Tuple[Position, int]:
+    """Return the best move for <p>.player and red player's value for <p>,
+    searched as in advanced_alpha_beta() by a pool of <jobs> processes.
+
+    The root moves are split between the processes once the first of them,
+    in the order of the move ordering, has been searched here to give the
+    others a bound (young brothers wait). Each process searches its moves
+    with its own transposition table. If <deterministic> is True, every
+    move is searched with empty tables, so that the values, and the move
+    chosen among those of equal value, do not depend on how the moves were
+    shared out.
+    """
+    if jobs <= 1 or depth <= 2:
+        return advanced_alpha_beta(p, -INFINITY, INFINITY, depth)
+    if deterministic:
+        table.clear()
+        ordering.clear()
+    b = Board(p)
+    if terminal(b):
+        return p, heuristic(b)
+    moves = ordering.order(b, b.generate(), 0)
+    entry = table.probe(b.key)
+    if entry is not None:
+        moves = hash_move_first(moves, entry[3])
+    b.make(moves[0])
+    first = search(b, -INFINITY, INFINITY, depth - 1, heuristic, table,
+                   ordering, ply=1, tablebase=tablebase)[1]
+    b.unmake(moves[0])
+    # A younger brother is only better than the first move if its value is
+    # beyond that of the first move.
+    if b.player == "red":
+        alpha, beta = first, INFINITY
     else:
-        value = INFINITY
-    for i in sort_successors(successors(p)):
-        if str(i.state) in explored:
-            nxt_val = explored[str(i.state)]
-        else:
-            nxt_val = advanced_alpha_beta(i, alpha, beta, depth)[1]
-            explored[str(i.state)] = nxt_val
-        if p.player == "red":
-            if value < nxt_val:
-                value, best_move = nxt_val, i
-            if value >= beta:
-                if best_move is None:
-                    best_move = p
-                return best_move, value
-            alpha = max(alpha, value)
-        else:
-            if value > nxt_val:
-                value, best_move = nxt_val, i
-            if value <= alpha:
-                if best_move is None:
-                    best_move = p
-                return best_move, value
-            beta = min(beta, value)
-    if best_move is None:
-        best_move = p
-    return best_move, value
+        alpha, beta = -INFINITY, first
+    file = None if tablebase is None else tablebase.file
+    tasks = [(p.player, p.state, move, depth - 1, alpha, beta, deterministic,
+              file) for move in moves[1:]]
+    with multiprocessing.Pool(min(jobs, max(len(tasks), 1))) as pool:
+        values = [first] + pool.map(search_root_move, tasks)
+    best = 0
+    for n in range(1, len(moves)):
+        if b.player == "red" and values[n] > values[best] or \
+                b.player == "black" and values[n] < values[best]:
+            best = n
+    return result(p, b, moves[best], table), values[best]
+
+# A position cache file starts with the magic string, followed by records of
+# the Zobrist key, the player to move (0 for red, 1 for black), the depth,
+# red player's value and the best move packed by encode_move().
+CACHE_MAGIC = b"CHKPC001"
+CACHE_RECORD = struct.Struct("=QBbiQ")
+
+class PositionCache:
+    """The best moves found by earlier searches, kept in a file on disk to
+    which every new result is appended. A later record of a position
+    overrides the earlier ones.
+
+    === Attributes ===
+    file:
+        The file the cache is stored in.
+    entries:
+        entries[(key, player)] is (depth, value, move) for the position of
+        Zobrist key <key> with <player> to move: it was searched to <depth>,
+        found to have red player's value <value> and best move <move>,
+        packed by encode_move().
+    """
+    file: str
+    entries: dict
+
+    def __init__(self, file: str) -> None:
+        """Load the cache stored in <file>, or start an empty one if there
+        is no such file.
+        """
+        self.file = file
+        self.entries = {}
+        if not os.path.exists(file):
+            f = open(file, 'wb')
+            f.write(CACHE_MAGIC)
+            f.close()
+            return
+        f = open(file, 'rb')
+        data = f.read()
+        f.close()
+        if data[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+            raise ValueError(file + " is not a checkers position cache")
+        # A record cut short by an interrupted write is ignored.
+        end = len(data) - (len(data) - len(CACHE_MAGIC)) % CACHE_RECORD.size
+        for key, player, depth, value, move in CACHE_RECORD.iter_unpack(
+                data[len(CACHE_MAGIC):end]):
+            self.entries[(key, player)] = (depth, value, move)
+
+    def lookup(self, p: Position, depth: int) -> Optional[Tuple[Position, int]]:
+        """Return the Position after the best move for <p>.player and red
+        player's value for <p>, if <p> has been searched to at least
+        <depth>, or None otherwise.
+        """
+        entry = self.entries.get((p.key, p.player == "black"))
+        if entry is None or entry[0] < depth:
+            return None
+        b = Board(p)
+        # The move is checked to be legal, in case of a key collision.
+        moves = hash_move_first(b.moves(), entry[2])
+        if not moves or encode_move(moves[0]) != entry[2]:
+            return None
+        return result(p, b, moves[0], table), entry[1]
+
+    def store(self, p: Position, new: Position, depth: int,
+              value: int) -> None:
+        """Record that the best move for <p>.player leads to <new> and that
+        red player's value for <p> is <value>, searched to <depth>. Nothing
+        is recorded if <new> cannot be reached from <p> in one move or if
+        <p> was searched deeper before.
+        """
+        entry = self.entries.get((p.key, p.player == "black"))
+        if entry is not None and entry[0] > depth:
+            return
+        b = Board(p)
+        for move in b.moves():
+            b.make(move)
+            found = b.key == new.key
+            b.unmake(move)
+            if found:
+                self.entries[(p.key, p.player == "black")] = \
+                    (depth, value, encode_move(move))
+                f = open(self.file, 'ab')
+                f.write(CACHE_RECORD.pack(p.key, p.player == "black", depth,
+                                          value, encode_move(move)))
+                f.close()
+                return
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python3 checkers.py <input file> <output file>")
+    parser = argparse.ArgumentParser(
+        usage="python3 checkers.py <input file> <output file>")
+    parser.add_argument("input", nargs="?")
+    parser.add_argument("output", nargs="?")
+    parser.add_argument("--depth", type=int, default=DEPTH, metavar="D",
+                        help="search D - 1 moves ahead, for D from 2 to "
+                             "{} (default %(default)s)".format(MAX_DEPTH))
+    parser.add_argument("--time", type=float, metavar="SECONDS",
+                        help="search deeper and deeper, up to --depth, for "
+                             "SECONDS and write the best move of the deepest "
+                             "completed search")
+    parser.add_argument("--nodes", type=int, metavar="N",
+                        help="like --time, but stop after N nodes")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="split the moves of the input between N "
+                             "processes (default %(default)s)")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="with --jobs, search every move with empty "
+                             "tables so that the output does not depend on "
+                             "how the moves are shared out")
+    parser.add_argument("--tablebase", metavar="FILE",
+                        help="look up the positions with few pieces in the "
+                             "endgame tablebase in FILE")
+    parser.add_argument("--build-tablebase", metavar="FILE",
+                        help="build the endgame tablebase of the positions "
+                             "with at most --pieces pieces, write it to FILE "
+                             "and exit")
+    parser.add_argument("--pieces", type=int, default=3, metavar="N",
+                        help="the largest number of pieces of the positions "
+                             "in the tablebase built, at most {}; 3 take half a "
+                             "minute to build, 4 about 25 minutes (default "
+                             "%(default)s)".format(MAX_PIECES))
+    parser.add_argument("--cache", metavar="FILE",
+                        help="answer from the position cache in FILE if the "
+                             "input was searched to --depth before, and add "
+                             "the result of the search to it otherwise")
+    args = parser.parse_args()
+    if args.build_tablebase:
+        if not 2 <= args.pieces <= MAX_PIECES:
+            parser.error("--pieces must be from 2 to {}".format(MAX_PIECES))
+        build_tablebase(args.build_tablebase, args.pieces)
         sys.exit()
-    # solution(sys.argv[2], alpha_beta(start(sys.argv[1]), -INFINITY, INFINITY, DEPTH)[0])
-    solution(sys.argv[2], advanced_alpha_beta(start(sys.argv[1]), -INFINITY, INFINITY, DEPTH)[0])
+    if args.output is None:
+        parser.error("the input and output files are required")
+    if not 2 <= args.depth <= MAX_DEPTH:
+        parser.error("--depth must be from 2 to {}".format(MAX_DEPTH))
+    if args.tablebase:
+        tablebase = Tablebase(args.tablebase)
+    if args.jobs > 1 and (args.time is not None or args.nodes is not None):
+        parser.error("--jobs cannot be combined with --time or --nodes")
+    p = start(args.input)
+    cache = None
+    if args.cache:
+        cache = PositionCache(args.cache)
+        found = cache.lookup(p, args.depth)
+        if found is not None:
+            solution(args.output, found[0])
+            sys.exit()
+    depth = args.depth
+    if args.time is not None or args.nodes is not None:
+        new, value, depth = iterative_deepening(p, args.depth, args.time,
+                                                args.nodes)
+    elif args.jobs > 1:
+        new, value = parallel_search(p, args.depth, args.jobs,
+                                     args.deterministic)
+    else:
+        # new, value = alpha_beta(p, -INFINITY, INFINITY, args.depth)
+        new, value = advanced_alpha_beta(p, -INFINITY, INFINITY, args.depth)
+    if cache is not None:
+        cache.store(p, new, depth, value)
+    solution(args.output, new)